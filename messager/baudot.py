@@ -8,10 +8,10 @@
 #    License: LGPL
 #
 #    This is intended for use with systems that are converting to and from
-#    Baudot just before printing.  It's not intended for bulk conversion.
+#    Baudot just before printing.
 #    Because the shift state (LTRS or FIGS) of the printer matters in Baudot, the input
-#    and output in interactive applications have to be coordinated.  So batch
-#    encoding is not useful.
+#    and output in interactive applications have to be coordinated.  So bulk
+#    encoding takes the printer's shift state and column, and returns the new ones.
 #
 #    This module just handles the code conversions.  Machine handling is in "baudottty".
 #
@@ -19,10 +19,80 @@
 #    J. Nagle
 #    February, 2009
 #
+import re
+import threading
+import unicodedata
 #
-#    class Baudot --  convert to and from Baudot for one printer.
+#    Regular expressions
 #
-class Baudot(object) :
+reshifts = re.compile(b'([\x1b\x1f])')             # split Baudot at FIGS and LTRS, keeping them
+#
+#    Substitutions for characters not in a Baudot character set.
+#
+#    Used only when the character set lacks the character.  A substitution
+#    containing characters the set also lacks is itself converted, so
+#    "%" becomes " pct." in USTTY and " pct # # # " in FRACTIONS.
+#
+CHARSUBS = {
+    '[' : '(', '{' : '(', '<' : '(',                # all left bracket types to (
+    ']' : ')', '}' : ')', '>' : ')',                # all right bracket types to )
+    '%' : ' pct.',                                  # spell out % abbrev
+    '|' : '-', '_' : '-', '~' : '-',                # to hyphen
+    '@' : ' at ', '+' : ' plus ', '=' : ' equals ',
+    '\\' : '/', '`' : "'", '*' : '', '^' : '',      # emphasis marks are dropped
+    '\t' : ' ',
+    '.' : ' # # # ', '!' : ' # # # ',               # stops, for FRACTIONS
+    '(' : ' -- ', ')' : ' -- ', ':' : ' -- ', ';' : ' -- ', ',' : ' -- ',  # other punct, for FRACTIONS
+    u'\u2018' : "'", u'\u2019' : "'", u'\u201a' : "'", u'\u201b' : "'",   # smart single quotes
+    u'\u2032' : "'", u'\u2039' : "'", u'\u203a' : "'",
+    u'\u201c' : '"', u'\u201d' : '"', u'\u201e' : '"', u'\u201f' : '"',   # smart double quotes
+    u'\u2033' : '"', u'\u00ab' : '"', u'\u00bb' : '"',
+    u'\u2012' : '-', u'\u2013' : '-', u'\u2014' : '--', u'\u2015' : '--', u'\u2212' : '-',  # dashes
+    u'\u2026' : '...', u'\u2022' : '-', u'\u00b7' : '-',
+    u'\u2044' : '/', u'\u00f7' : '/', u'\u00d7' : 'x',
+    u'\u00bc' : ' 1/4', u'\u00bd' : ' 1/2', u'\u00be' : ' 3/4',   # vulgar fractions, apart from any whole number
+    u'\u2150' : ' 1/7', u'\u2151' : ' 1/9', u'\u2152' : ' 1/10', u'\u2153' : ' 1/3', u'\u2154' : ' 2/3',
+    u'\u2155' : ' 1/5', u'\u2156' : ' 2/5', u'\u2157' : ' 3/5', u'\u2158' : ' 4/5', u'\u2159' : ' 1/6',
+    u'\u215a' : ' 5/6', u'\u215b' : ' 1/8', u'\u215c' : ' 3/8', u'\u215d' : ' 5/8', u'\u215e' : ' 7/8',
+    u'\u00a9' : '(C)', u'\u00ae' : '(R)', u'\u2122' : '(TM)',
+    u'\u00b0' : ' deg.', u'\u00a2' : ' cents', u'\u00a3' : ' pounds', u'\u20ac' : ' euros',
+    u'\u00a7' : 'sec.', u'\u00b6' : '', u'\u00a1' : '!', u'\u00bf' : '?',
+    u'\u00df' : 'ss', u'\u00e6' : 'ae', u'\u00c6' : 'AE', u'\u0153' : 'oe', u'\u0152' : 'OE',
+    u'\u00f8' : 'o', u'\u00d8' : 'O', u'\u0111' : 'd', u'\u0110' : 'D', u'\u0142' : 'l', u'\u0141' : 'L',
+    u'\u00fe' : 'th', u'\u00de' : 'TH', u'\u00f0' : 'd', u'\u00d0' : 'D', u'\u0131' : 'i' }
+#
+#    Substitutions by Unicode category, if there is no specific one and no decomposition
+#
+CATEGORYSUBS = {
+    'Zs' : ' ', 'Zl' : '\n', 'Zp' : '\n',           # spaces and line breaks
+    'Pd' : '-', 'Pi' : '"', 'Pf' : '"',             # dashes and quotes
+    'Ps' : '(', 'Pe' : ')',                         # brackets
+    'Cc' : '', 'Cf' : '', 'Mn' : '', 'Me' : '' }    # controls, formatting, and accents are dropped
+#
+#    class TranslateTable  --  str.translate table to a Baudot character set
+#
+#    ASCII and Latin-1 are converted when the table is built.  Other characters
+#    are converted the first time they are seen.
+#
+class TranslateTable(dict) :
+    def __init__(self, conv) :
+        self.conv = conv                            # Charset object
+        for chn in range(256) :                     # the usual chars
+            self[chn]
+
+    def __missing__(self, chn) :                    # new char, convert and remember
+        s = self.conv.transliterate(chr(chn))
+        self[chn] = s
+        return(s)
+#
+#    class Charset  --  compiled conversion tables for one Baudot character set
+#
+#    Built once per character set, by "lookupcharset" or "registercharset", and
+#    shared read only by all Baudot objects and threads using that set.  The
+#    tables are tuples and bytes.  Only the Unicode cache in "translatetab" grows,
+#    and filling an entry twice does no harm.
+#
+class Charset(object) :
                                                 # control chars as integer constants
     FIGS =  0x1b                                # FIGS/LTRS shift chars in Baudot
     LTRS =  0x1f
@@ -65,19 +135,17 @@ class Baudot(object) :
     assert(len(FractionsFigs) == 32)                # exactly 32
 
     SHIFTS = (LTRS, FIGS, None)                     # "None" means we don't know what shift the printer is in.
+    UNSHIFTMODES = (True, False, None)              # unshift on space: yes, no, don't know
     
-    def __init__(self, charset=None) :
-        self.substitutechar = None                  # substitute for bad chars (ASCII)
-        self.tobaudottab = None                     # conversion table for conversion to Baudot
-        self.toasciiltrstab = None                  # to ASCII, LTRS portion
-        self.toasciifigstab = None                  # to ASCII, FIGS portion
-        if charset is None :
-            charset = "USTTY"                       # default charset
-        self.charset = charset.upper()              # store char set
-        if not self.charset in Baudot.CHARSETS :         # if config error
-            raise(ValueError('Character set "%s" requested, not supported.' % (self.charset,)))
-        (ltrtab, figtab) = Baudot.CHARSETS[self.charset] # look up character set
-        self.buildconversion(ltrtab, figtab)        # build conversion table
+    def __init__(self, charset, ltrstab, figstab, substitutechar='?') :
+        self.charset = charset.upper()              # name of char set
+        for tab in (ltrstab, figstab) :             # check tables
+            if len(tab) != 32 :
+                raise ValueError('Character set "%s" must have 32 LTRS and 32 FIGS chars.' % (self.charset,))
+            for ch in tab :
+                if not (ch is None or (isinstance(ch, str) and len(ch) == 1 and ord(ch) < 128)) :
+                    raise ValueError('Character set "%s" has a bad char: %s' % (self.charset, repr(ch)))
+        self.buildconversion(tuple(ltrstab), tuple(figstab), substitutechar)  # build conversion tables
         
     def getcharset(self) :
         """
@@ -90,23 +158,115 @@ class Baudot(object) :
         self.toasciifigstab = figstab
         self.substitutechar = substitutechar        # set substitute char (ASCII)
         #    Build ASCII -> Baudot table
-        self.tobaudottab = []                       # the conversion table 0..127
-        for i in range(128) :                       # initialize entries to unknown char
-            self.tobaudottab.append((None, None))   # no data
+        tobaudottab = [(None, None)] * 128          # the conversion table 0..127, entries unknown
         for i in range(len(ltrstab)) :              # build LTRS part of table
             if not ltrstab[i] is None :             # skip untranslatables
-                self.tobaudottab[ord(ltrstab[i].lower())] = (i, Baudot.LTRS)
-                self.tobaudottab[ord(ltrstab[i].upper())] = (i, Baudot.LTRS) 
+                tobaudottab[ord(ltrstab[i].lower())] = (i, Charset.LTRS)
+                tobaudottab[ord(ltrstab[i].upper())] = (i, Charset.LTRS) 
         for i in range(len(figstab)) :              # build FIGS part of table
             if not figstab[i] is None :             # skip untranslatables
-                shift = Baudot.FIGS                 # assume need FIGS shift
+                shift = Charset.FIGS                # assume need FIGS shift
                 if ltrstab[i] == figstab[i] :       # if same char in both shifts
                     shift = None                    # never need a shift 
-                self.tobaudottab[ord(figstab[i])] = (i, shift)    #
-        assert(len(self.tobaudottab) == 128)        # length check 
-        for (bb,shift) in self.tobaudottab :        # all Baudot entries
-            if not (bb is None) :                   # Python 2/3 issue
-                assert(isinstance(bb,int))          # must be int
+                tobaudottab[ord(figstab[i])] = (i, shift)    #
+        self.tobaudottab = tuple(tobaudottab)       # read only from here on
+        self.encodetabs = {}                        # state machines for bulk encoding
+        for unshiftonspace in Charset.UNSHIFTMODES :    # one per unshift on space behavior
+            self.encodetabs[unshiftonspace] = self.buildencodetab(unshiftonspace)
+        self.nonspacing = ''.join(chr(chn) for chn in range(128)   # ASCII chars which don't move the carriage
+            if self.encodetabs[None][Charset.LTRS][chn][2] != 1)    # for word wrap column counting
+        self.needshifttab = tuple(self.chToBaudot(chn)[1] for chn in range(256))  # shift needed, by ASCII byte
+        self.decodetab = {                          # translation tables for bulk decoding
+            Charset.LTRS : self.builddecodetab(ltrstab),
+            Charset.FIGS : self.builddecodetab(figstab),
+            None : self.builddecodetab(ltrstab) }   # unknown shift is treated as LTRS, like chToASCII
+        self.translatetab = TranslateTable(self)    # for converting text to printable chars
+
+    #
+    #   transliterate  --  best printable equivalent of a Unicode char
+    #
+    #   Returns a string of chars in this character set, perhaps empty.
+    #   Accented letters lose their accents, and compatibility forms such
+    #   as ligatures and full width letters become their ASCII equivalents.
+    #
+    def transliterate(self, ch, depth=0) :
+        chn = ord(ch)
+        if chn < 128 and self.tobaudottab[chn][0] is not None :  # if printable as is
+            return(ch)
+        sub = CHARSUBS.get(ch)                      # specific substitution
+        if sub is None :
+            decomp = ''.join(c for c in unicodedata.normalize('NFKD', ch) if not unicodedata.combining(c))
+            if decomp != ch :                       # if decomposes to something else
+                sub = decomp                        # use that
+            else :
+                sub = CATEGORYSUBS.get(unicodedata.category(ch))    # general substitution
+        if sub is None or depth > 3 :               # if nothing reasonable
+            return(self.substitutechar)
+        return(''.join(self.transliterate(c, depth+1) for c in sub))    # convert substitution too
+
+    #
+    #   buildencodetab  --  build state machine table for bulk encoding
+    #
+    #   Returns a dict indexed by shift state (LTRS, FIGS, or None), each entry
+    #   a tuple indexed by ASCII byte value 0..255.  Each list entry is
+    #   (baudotbytes, newshift, advance, shiftsent), where "advance" is 1 if the char moves
+    #   the carriage, 0 if not, and -1 for CR, which needs end of line processing.
+    #   "shiftsent" is 1 if a FIGS or LTRS had to be sent first.
+    #   Out of range and untranslatable chars are replaced by the substitute char.
+    #
+    #   "unshiftonspace" is True if the machine goes to LTRS on SPACE, False if
+    #   it stays in FIGS, and None if we don't know.
+    #
+    def buildencodetab(self, unshiftonspace=None) :
+        tab = {}
+        for shift in Charset.SHIFTS :               # for all shift states
+            entries = []
+            for chn in range(256) :                 # for all byte values
+                (bb, needshift) = self.chToBaudot(chn)  # convert char to Baudot and shift
+                if bb is None :                     # no substitute char available
+                    raise IndexError("Unknown character to convert to Baudot")
+                sout = bytearray()
+                newshift = shift
+                shiftsent = 0
+                if needshift is not None and needshift != shift :  # if shift needed
+                    sout.append(needshift)          # do shift
+                    newshift = needshift            # update shift state
+                    shiftsent = 1
+                if bb == Charset.LTRS :             # if LTRS
+                    newshift = Charset.LTRS
+                elif bb == Charset.FIGS :           # if FIGS
+                    newshift = Charset.FIGS
+                elif bb == Charset.SPACE :          # SPACE may unshift
+                    if unshiftonspace :             # machine always unshifts
+                        newshift = Charset.LTRS     # now in LTRS, whatever the shift was
+                    elif unshiftonspace is None and newshift == Charset.FIGS :  # if possible unshift on space
+                        newshift = None             # now unknown
+                if bb == Charset.CR :               # CR needs end of line processing
+                    entries.append((bytes(sout), newshift, -1, shiftsent))
+                    continue
+                sout.append(bb)
+                advance = 0
+                if self.printableBaudot(bb, newshift) :  # spacing char
+                    advance = 1
+                entries.append((bytes(sout), newshift, advance, shiftsent))
+            tab[shift] = tuple(entries)
+        return(tab)
+
+    #
+    #   builddecodetab  --  build translation table for bulk decoding, one shift
+    #
+    #   Returns (table, deletechars) for "bytes.translate".  Baudot chars with no
+    #   ASCII equivalent are deleted.  Out of range bytes become the substitute char.
+    #
+    def builddecodetab(self, asciitab) :
+        table = bytearray(ord(self.substitutechar) for i in range(256))
+        deletechars = bytearray()
+        for i in range(len(asciitab)) :             # for all Baudot chars
+            if asciitab[i] is None :                # if no ASCII equivalent
+                deletechars.append(i)               # drop it
+            else :
+                table[i] = ord(asciitab[i])
+        return(bytes(table), bytes(deletechars))
 
     #
     #   printableBaudot -- true if Baudot char advances char position
@@ -116,7 +276,7 @@ class Baudot(object) :
     #   We use the tables because the Baudot value of BELL varies.
     #
     def printableBaudot(self, chn, shift) :
-        if shift == Baudot.FIGS :                   # convert to ASCII, to find out if printable
+        if shift == Charset.FIGS :                  # convert to ASCII, to find out if printable
             ach = self.toasciifigstab[chn]
         else :    
             ach = self.toasciiltrstab[chn]
@@ -139,7 +299,7 @@ class Baudot(object) :
                 raise IndexError("Out of range character to convert to Baudot")
             chn = ord(self.substitutechar)          # use substitute char
         b = self.tobaudottab[chn]                   # convert to Baudot and shift
-        if b is None :                              # if no conversion available
+        if b[0] is None :                           # if no conversion available
             if self.substitutechar is None :        # if no substitution char for bad chars
                 raise IndexError("Unknown character to convert to Baudot")
             chn = ord(self.substitutechar)          # use substitute char
@@ -159,7 +319,7 @@ class Baudot(object) :
             if self.substitutechar is None :        # if no substitution char for bad chars
                 raise IndexError("Out of range character to convert to ASCII")
             return(self.substitutechar)             # use substitute char
-        if shift == Baudot.FIGS :                   # if in FIGS
+        if shift == Charset.FIGS :                  # if in FIGS
             ch = self.toasciifigstab[bn]            # convert figure to ASCII
         else :
             ch = self.toasciiltrstab[bn]            # convert letter to ASCII
@@ -167,4 +327,239 @@ class Baudot(object) :
             return(None)                            # use substitute char
         assert(isinstance(ch, str))                 # ***TEMP***
         return(ch)
-                
+
+#
+#    Registry of compiled character sets, shared by all Baudot objects.
+#
+charsets = {}                                       # Charset objects by name
+charsetlock = threading.Lock()                      # lock for "charsets"
+#
+#    Escapes for character set tables in configuration files.
+#    Leading and trailing spaces are not kept in config values, so SPACE is "\s".
+#
+CHARSETESCAPES = {"\\0" : "\0", "\\a" : "\a", "\\n" : "\n", "\\r" : "\r", "\\s" : " ", "\\\\" : "\\" }
+CHARSETNONE = "\\*"                                 # escape for no ASCII equivalent (FIGS, LTRS)
+
+#
+#   lookupcharset  --  get the compiled tables for a character set, building them if needed
+#
+def lookupcharset(charset) :
+    name = charset.upper()
+    with charsetlock :
+        cs = charsets.get(name)                     # if already built
+        if cs is None :                             # first use, build it
+            if not name in Charset.CHARSETS :       # if config error
+                raise(ValueError('Character set "%s" requested, not supported.' % (name,)))
+            (ltrstab, figstab) = Charset.CHARSETS[name]  # look up character set
+            cs = Charset(name, ltrstab, figstab)
+            charsets[name] = cs
+    return(cs)
+
+#
+#   registercharset  --  add or replace a character set
+#
+#   Baudot objects already using a replaced set keep the old tables.
+#
+def registercharset(charset, ltrstab, figstab) :
+    cs = Charset(charset, ltrstab, figstab)         # build, raises ValueError if bad
+    with charsetlock :
+        charsets[cs.charset] = cs
+    return(cs)
+
+#
+#   parsecharsettab  --  convert a config file line of 32 chars to a LTRS or FIGS table
+#
+def parsecharsettab(s) :
+    tab = []
+    for item in re.findall(r'\\.|.', s.strip()) : # chars and escapes
+        if item == CHARSETNONE :                    # no ASCII equivalent
+            tab.append(None)
+        else :
+            tab.append(CHARSETESCAPES.get(item, item))
+    return(tab)
+
+#
+#    class Baudot --  convert to and from Baudot for one printer.
+#
+#    Holds the shared tables for its character set, so creating one is cheap.
+#    The Charset methods and tables are reached through this object.
+#
+class Baudot(object) :
+    FIGS = Charset.FIGS                             # control chars, as in Charset
+    LTRS = Charset.LTRS
+    LF = Charset.LF
+    CR = Charset.CR
+    SPACE = Charset.SPACE
+    NULL = Charset.NULL
+
+    def __init__(self, charset=None) :
+        if charset is None :
+            charset = "USTTY"                       # default charset
+        self.tables = lookupcharset(charset)        # the shared compiled tables
+
+    def __getattr__(self, name) :                   # anything not here is in the tables
+        if name == "tables" :                       # not set up, don't recurse
+            raise AttributeError(name)
+        return(getattr(self.tables, name))
+
+    #
+    #   encode  --  convert an ASCII string to Baudot in one pass
+    #
+    #   Input is ASCII, as "bytes" or "str", with newlines already converted to CR.
+    #   "startshift" and "startcol" are the printer state before the string;
+    #   None means unknown.  "colmax" is the carriage width, or None for no
+    #   automatic CR.  "eolextralf" and "eolextraltrs" are the end of line settings
+    #   of the TTY.  "unshiftonspace" is True if the machine goes to LTRS on SPACE,
+    #   False if it stays in FIGS, and None if we don't know.  Same output as
+    #   sending each char through "BaudotTTY.writebaudotch", except that a SPACE
+    #   on a machine known to unshift on space leaves it in LTRS even when the
+    #   shift was unknown before.
+    #
+    #   Returns (baudotbytes, finalshift, finalcol)
+    #
+    def encode(self, text, startshift=None, startcol=None, colmax=None, eolextralf=False, eolextraltrs=0,
+            unshiftonspace=None) :
+        if not isinstance(text, (bytes, bytearray)) :   # if string
+            text = text.encode('ascii','replace')   # get clean ASCII as bytes
+        eolcr = bytearray([Baudot.CR])              # end of line sequence when not at column 0
+        if eolextralf :                             # if machine needs LF on CR
+            eolcr.append(Baudot.LF)
+        eolcr.extend([Baudot.LTRS] * eolextraltrs)  # extra LTRS to allow time for CR
+        eolcr = bytes(eolcr)
+        eolshift = None                             # end of line does not change shift
+        if eolextraltrs > 0 :                       # unless extra LTRS sent
+            eolshift = Baudot.LTRS
+        tab = self.tables.encodetabs[unshiftonspace]    # the state machine
+        shift = startshift
+        col = startcol
+        sout = bytearray()
+        if col is None and len(text) > 0 :          # if position unknown
+            sout += eolcr                           # force a CR
+            if eolshift is not None :
+                shift = eolshift
+            col = 0
+        for chn in bytearray(text) :                # for all chars
+            (bb, shift, advance, shiftsent) = tab[shift][chn]  # one state transition
+            sout += bb                              # shift (if any) and char
+            if advance >= 0 :                       # not CR
+                col += advance
+                if colmax is None or col < colmax : # if no CR processing needed
+                    continue
+            #   End of line, requested or forced.
+            if col == 0 :                           # newline at start of line, just send LF
+                sout.append(Baudot.LF)
+            else :                                  # not at beginning of line
+                sout += eolcr                       # CR, LF, and extra LTRS
+                if eolshift is not None :
+                    shift = eolshift                # now in LTRS shift
+            col = 0                                 # now at beginning of line
+        return(bytes(sout), shift, col)
+
+    #
+    #   decode  --  convert Baudot to ASCII in bulk
+    #
+    #   Input is Baudot as "bytes", "bytearray" or "memoryview".
+    #   "startshift" is the shift state before the data; None means unknown.
+    #   FIGS and LTRS chars change the shift, and are not returned.
+    #   Chars with no ASCII equivalent are dropped.
+    #
+    #   Returns (text, finalshift)
+    #
+    def decode(self, data, startshift=None) :
+        shift = startshift
+        parts = []
+        pieces = reshifts.split(bytes(data))        # alternating text runs and shift chars
+        for i in range(len(pieces)) :
+            piece = pieces[i]
+            if i % 2 :                              # odd pieces are FIGS or LTRS
+                shift = bytearray(piece)[0]         # new shift state
+            elif len(piece) > 0 :                   # run of chars in one shift
+                (table, deletechars) = self.tables.decodetab[shift]
+                parts.append(piece.translate(table, deletechars))
+        return(b''.join(parts).decode('ascii'), shift)
+
+    #
+    #   encodeoptimized  --  convert an ASCII string to Baudot, sending as few shifts as possible
+    #
+    #   Like "encode", but the extra LTRS sent at end of line for carriage
+    #   return delay become FIGS when the next char that needs a shift is
+    #   a figure.  Looks ahead over SPACE, CR, LF, NULL, and the other
+    #   chars which are the same in both shifts.
+    #
+    #   Returns (baudotbytes, finalshift, finalcol, charssaved), where "charssaved"
+    #   is the number of shift chars "encode" would have sent and this did not.
+    #
+    def encodeoptimized(self, text, startshift=None, startcol=None, colmax=None, eolextralf=False,
+            eolextraltrs=0, unshiftonspace=None) :
+        if not isinstance(text, (bytes, bytearray)) :   # if string
+            text = text.encode('ascii','replace')   # get clean ASCII as bytes
+        text = bytearray(text)
+        eolcr = bytearray([Baudot.CR])              # end of line sequence when not at column 0
+        if eolextralf :                             # if machine needs LF on CR
+            eolcr.append(Baudot.LF)
+        eolcr = bytes(eolcr)
+        tab = self.tables.encodetabs[unshiftonspace]    # the state machine
+        ctab = tab                                  # what "encode" would do, for counting savings
+        shift = startshift
+        cshift = startshift                         # shift state "encode" would have
+        col = startcol
+        saved = 0
+        sout = bytearray()
+        i = -1                                      # position of char before end of line
+        if col is None and len(text) > 0 :          # if position unknown
+            col = -1                                # force a CR
+        while True :
+            if col is not None and col != 0 and (col < 0 or (colmax is not None and col >= colmax)) :
+                sout += eolcr                       # CR, LF
+                if eolextraltrs > 0 :               # extra chars for CR delay
+                    padshift = self.nextshift(text, i+1, unshiftonspace)  # shift the next char will need
+                    sout.extend([padshift] * eolextraltrs)
+                    shift = padshift
+                    cshift = Baudot.LTRS            # "encode" always sends LTRS here
+                col = 0                             # now at beginning of line
+            i += 1
+            if i >= len(text) :                     # done
+                break
+            chn = text[i]
+            (bb, shift, advance, shiftsent) = tab[shift][chn]  # one state transition
+            (cbb, cshift, cadvance, cshiftsent) = ctab[cshift][chn]
+            saved += cshiftsent - shiftsent         # count shifts avoided
+            sout += bb                              # shift (if any) and char
+            if advance >= 0 :                       # not CR
+                col += advance
+            elif col == 0 :                         # newline at start of line, just send LF
+                sout.append(Baudot.LF)
+            else :                                  # CR not at start of line
+                col = -1                            # do end of line on next cycle
+        return(bytes(sout), shift, col, saved)
+
+    #
+    #   nextshift  --  look ahead for the shift state that will be needed next
+    #
+    #   Returns LTRS or FIGS.  If nothing ahead needs a shift, or a SPACE will
+    #   unshift the machine first, LTRS.
+    #
+    def nextshift(self, text, start, unshiftonspace) :
+        needshifttab = self.tables.needshifttab
+        for i in range(start, len(text)) :          # scan ahead over shift-neutral chars
+            chn = text[i]
+            needshift = needshifttab[chn]
+            if needshift is not None :              # this char needs a shift
+                return(needshift)
+            if unshiftonspace and chn == 0x20 :     # SPACE will go to LTRS anyway
+                break
+        return(Baudot.LTRS)
+
+#
+#    Self test of conversions, run as a program.
+#
+def selftest() :
+    b = Baudot("USTTY")
+    for (s, expected) in [("1\u00bd", "1 1/2"), ("2\u00be cups", "2 3/4 CUPS"), ("\u215b inch", " 1/8 INCH"),
+            ("caf\u00e9", "CAFE"), ("50%", "50 PCT."), ("\u201cyes\u201d", '"YES"')] :
+        got = s.translate(b.translatetab).upper()
+        assert got == expected, "%s converted to %s, not %s" % (repr(s), repr(got), repr(expected))
+    print("Conversions OK.")
+
+if __name__ == "__main__" :                         # if run as a test
+    selftest()
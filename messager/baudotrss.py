@@ -27,6 +27,7 @@ import optparse
 import userinterface
 import configparser
 import baudottty
+import baudot
 import encodings.idna                           # force this in for Pyinstaller.
 
 
@@ -50,10 +51,10 @@ def get_script_dir():
 #
 #   opentty  --  create and open the TTY device
 #
-def opentty(port, baud, lf, extraltrs, charset) :
+def opentty(port, baud, lf, extraltrs, charset, leadtime=0.0) :
     extraltrs = min(10,max(1,extraltrs))        # sanity check
     tty = baudottty.BaudotTTY()                 # get a TTY object
-    tty.open(port, baud, charset, READTIMEOUT)  # initialize a TTY on indicated port
+    tty.open(port, baud, charset, READTIMEOUT, leadtime)  # initialize a TTY on indicated port
     tty.eolsettings(lf, extraltrs)              # set end of line defaults
     return(tty)                                 # a BaudotTTY object
 
@@ -127,6 +128,11 @@ def main() :
         if port.isdigit() :                                 # no longer allowed, pyserial change
             raise ValueError('Configuration error: "port" must be a name, such as COM1 or /dev/ttyUSB0')
         charset = config.get("teletype", "charset")         # USTTY, ITA2 or Fractions
+        for section in config.sections() :                  # user-defined character sets
+            if section.lower().startswith("charset ") :     # [charset NAME]
+                baudot.registercharset(section[len("charset "):].strip(),
+                    baudot.parsecharsettab(config.get(section, "ltrs", raw=True)),
+                    baudot.parsecharsettab(config.get(section, "figs", raw=True)))
         #   Get list of feeds from config
         for (k, v) in config.items("feeds") :               # get more from config
             if v and v.strip() != "" :                      # if non-null feed
@@ -139,13 +145,20 @@ def main() :
         #   Try to open serial port to Teletype
         extraltrs = config.getint("teletype", "extraltrs")  # extra LTRS at EOL
         lf = config.getboolean("teletype","lf")             # LF on CR teletype feature
-        tty = opentty(port, baud, lf, extraltrs, charset)   # open serial port, can raise
+        leadtime = config.getfloat("teletype", "leadtime")  # paced output, 0 for none
+        tty = opentty(port, baud, lf, extraltrs, charset, leadtime)   # open serial port, can raise
+        unshiftonspace = None                               # unshift on space unknown
+        if config.get("teletype", "unshiftonspace").strip() != "" :   # if configured
+            unshiftonspace = config.getboolean("teletype", "unshiftonspace")
+        tty.shiftsettings(unshiftonspace, 
+            config.getboolean("teletype", "optimizeshifts"))  # shift optimization
         logger.debug("Serial port: " + repr(tty.ser))       # print serial port settings
         if options.ryrypat or options.alphapat :            # if test pattern only       
             testpattern(tty, options)                       # just do dumb test pattern
             return                                          # and exit
         ui = userinterface.simpleui(tty, feedurls, config, logger) # user interface
-        ui.feeds.markallasread("NEWS")                      # mark all news as read
+        if not ui.feedstate :                               # unless we remember what was seen before
+            ui.feeds.markallasread("NEWS")                  # mark all news as read
     except (configparser.Error, ValueError) as message :
         print("\n\nConfiguration error - cannot start.\n%s" % (str(message),))
         return(1)
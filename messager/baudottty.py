@@ -15,6 +15,7 @@ import re
 import threading
 import time
 import dummyteletype
+from six.moves import queue                         # Python 2/3 support
 assert(serial.VERSION.split('.') >= ['2','4'])    # ***TEMP*** should be 2.5, but PySerial has wrong version string.
 #
 #    Constants
@@ -23,6 +24,8 @@ assert(serial.VERSION.split('.') >= ['2','4'])    # ***TEMP*** should be 2.5, bu
 #
 kspeedsafetymargin = (1.0 + 0.03)                   # allow for 3% speed error in print estimation
 kactualbaud = {600 : 45 }                           # remapping of baud rates by special USB devices.
+kwritechunk = 16                                    # chars per write, so BREAK can stop long output
+kspoolermaxjobs = 4                                 # print jobs that can wait in the spooler
 
 #
 #    Regular expressions
@@ -35,11 +38,28 @@ re1b = re.compile(r'\n')                            # for changing newline to CR
 class BaudotKeyboardInterrupt(Exception) :
     pass
 #
+#    class Rendered  --  a string converted to Baudot, ready to print
+#
+#    Conversion depends on the shift state and column at which printing starts.
+#    So does word wrapping, if requested.
+#
+class Rendered(object) :
+    def __init__(self, text, wrap, startshift, startcol, data, endshift, endcol, saved) :
+        self.text = text                            # the string, as submitted
+        self.wrap = wrap                            # true if word wrapped for the start column
+        self.startshift = startshift                # machine state assumed at start
+        self.startcol = startcol
+        self.data = data                            # Baudot bytes to send
+        self.endshift = endshift                    # machine state after printing
+        self.endcol = endcol
+        self.saved = saved                          # shift chars saved by optimization
+#
 #    class BaudotTTY  --  support for one Baudot TTY
 #
 class BaudotTTY(object) :
     def __init__(self) :
         self.ser = None                             # no serial port yet
+        self.writer = None                          # no paced output writer
         self.conv = None                            # no conversion table yet
         self.motoron = False                        # motor not running
         self.baud = None                            # do not know baud rate yet
@@ -47,8 +67,11 @@ class BaudotTTY(object) :
         self.motorstartdelay = 2.0                  # seconds to wait for motor start
         self.charsecs = 0.25                        # time to print one char, default
         self.lock = threading.Lock()                # lock object
+        self.wirestatsstart = time.time()           # start of wire busy measurement
+        self.wirebusysecs = 0.0                     # wire time used since then
         self.clear()                                # reset to start state
         self.eolsettings()                          # set EOL settings
+        self.shiftsettings()                        # set shift optimization settings
 
     def clear(self) :                               # reset to start state
         self.outputcol = None                       # output column position unknown
@@ -60,12 +83,19 @@ class BaudotTTY(object) :
         self.eolextraltrs = eolextraltrs            # send this many extra LTRS end of line (for CR delay)
         self.eolextralf = eolextralf                # send LF on CR (if machine doesn't do that in hardware)
 
+    def shiftsettings(self, unshiftonspace=None, optimize=False) :  # shift handling
+        self.unshiftonspace = unshiftonspace        # True if machine goes to LTRS on SPACE, None if unknown
+        self.optimizeshifts = optimize              # look ahead to send fewer FIGS and LTRS
+
 
 
     #
     #    open  --  open a serial port for 45.45 baud, 5N1.5
     #
-    def open(self, port, baud=45.45, charset="USTTY", timeout=None) :
+    #    "leadsecs", if nonzero, turns on paced output.  No more than that
+    #    much output is allowed to get ahead of the printer.
+    #
+    def open(self, port, baud=45.45, charset="USTTY", timeout=None, leadsecs=0.0) :
         if self.ser :
             self.close()                            # close old port instance
         if port == "TEST" :                         # if dummy test object
@@ -87,11 +117,17 @@ class BaudotTTY(object) :
         self.conv = baudot.Baudot(charset)          # get Baudot conversion object
         self.ser.dtr = True                         # DTR to 1, so we can use DTR as a +12 supply 
         self.ser.rts = False                        # motor is initially off
+        if leadsecs > 0.0 :                         # if paced output
+            self.writer = BaudotWriter(self.ser, self.charsecs, leadsecs)
+            self.writer.start()                     # start writer thread
 
     #
     #    close  --  close port
     #
     def close(self) :
+        if self.writer :                            # if paced output
+            self.writer.abort()                     # stop writer thread
+            self.writer = None
         with self.lock :                            # lock
             if self.ser :                           # output
                 self.ser.rts = False                # stop motor
@@ -132,7 +168,18 @@ class BaudotTTY(object) :
     #   lock. Then we can do the flush again, with the lock set, and set the
     #   machine state accordingly.
     #
+    #   With paced output, little is queued in the device, so the writer
+    #   just discards what it has not yet released.
+    #
     def flushOutput(self) :
+        if self.writer :                            # if paced output
+            with self.lock :                        # writes do not block, so no wait here
+                self.kybdinterrupt = True           # set keyboard interrupt
+                self.writer.flush()                 # discard unsent output
+                self.outputshift = None             # shift state unknown
+                self.outputcol = None               # column position unknown
+                self.printend = time.time()         # est. printing completion time is now
+            return
         self.ser.flushOutput()                      # initial flush in case output blocked and lock held
         self.ser.baudrate = 115200                  # set huge baud rate, 200x Teletype rate 
         with self.lock :
@@ -154,11 +201,15 @@ class BaudotTTY(object) :
     #   Input is array of bytes
     #
     def _writeser(self, s) :
-        self.ser.write(s)                           # write
+        if self.writer :                            # if paced output
+            self.writer.write(s)                    # writer thread will send it
+        else :
+            self.ser.write(s)                       # write
         now = time.time()                           # calc time left to finish printing
         if now > (self.printend + 1.0) :            # if printing should have finished by now
             self.printend = now                     # restart printing timer
         self.printend +=  len(s) * self.charsecs    # add to est. printing completion time
+        self.wirebusysecs += len(s) * self.charsecs # time wire is busy, for statistics
 
     #
     #    _writeeol  --  write end of line sequence
@@ -189,8 +240,11 @@ class BaudotTTY(object) :
     #    Used to decide when to turn motor off.
     #    The USB to serial converter has a huge buffer, and we can't tell when it is empty.
     #    So we have to estimate by counting output chars and timing.
+    #    With paced output, the writer knows.
     #        
     def outwaitingtime(self) :
+        if self.writer :                            # if paced output
+            return(self.writer.outwaitingtime())    # exact time left to end of printing
         return(max(0.0, self.printend - time.time()    + 1.0))  # est. time left to end of printing
     #
     #    outwaiting -- number of chars remaining to print
@@ -202,6 +256,30 @@ class BaudotTTY(object) :
     def outwaiting(self) :
         charsleft = int(max(0, self.outwaitingtime() / self.charsecs))    # chars left to print
         return(charsleft)
+
+    #
+    #    resetwirestats  --  start measuring how busy the wire is
+    #
+    def resetwirestats(self) :
+        with self.lock :
+            self.wirestatsstart = time.time()       # start of measurement
+            self.wirebusysecs = 0.0                 # wire time used since then
+
+    #
+    #    getwirebusy  --  percentage of time the wire has been busy since "resetwirestats"
+    #
+    #   Measured to when output already sent will finish printing.
+    #
+    def getwirebusy(self) :
+        if self.writer :                            # if paced output, writer knows
+            printend = time.time() + self.writer.outwaitingtime()
+        else :                                      # estimate, without the safety allowance
+            printend = max(time.time(), self.printend)
+        with self.lock :
+            elapsed = printend - self.wirestatsstart    # time since measurement started
+            if elapsed <= 0.0 :                     # nothing measured
+                return(0.0)
+            return(min(100.0, 100.0 * self.wirebusysecs / elapsed))
             
     #
     #    writebaudotch  --  write chars in Baudot.  All output must go through here.
@@ -228,7 +306,10 @@ class BaudotTTY(object) :
             elif ch == baudot.Baudot.FIGS :         # if FIGS
                 self.outputshift = baudot.Baudot.FIGS    # now in FIGS
             elif ch == baudot.Baudot.SPACE and self.outputshift == baudot.Baudot.FIGS : # if possible unshift on space
-                self.outputshift = None             # now unknown
+                if self.unshiftonspace :            # if machine always unshifts
+                    self.outputshift = baudot.Baudot.LTRS  # now in LTRS
+                elif self.unshiftonspace is None :  # if we don't know
+                    self.outputshift = None         # now unknown
             #    Handle line position update    
             if ch == baudot.Baudot.CR  :            # if CR was requested
                 self._writeeol()                    # do end of line processing
@@ -249,74 +330,385 @@ class BaudotTTY(object) :
         return(self.ser.read())                     # return Baudot string read
 
     #
-    #    doprint --  print string to serial port, with appropriate conversions
+    #    _prepare  --  convert string for printing to ASCII bytes, with CR for newline
     #
-    def doprint(self, s) :
+    def _prepare(self, s) :
         s = re1a.sub('',s)                          # remove all CR
         s = re1b.sub('\r',s)                        # change newline to CR
-        s = s.encode('ascii','replace')             # text might contain Unicode, get clean ASCII as bytes
-        for ch in s :                               # for all chars
-            if self.kybdinterrupt :                 # if interrupted
-                break                               # stop typing
-            (bb, shift) = self.conv.chToBaudot(ch)  # convert char to Baudot and shift
-            ####print("Doprint: %s -> %2d %s" % (repr(ch), ord(b), repr(shift)))    # ***TEMP***
-            self.writebaudotch(bb,shift)            # write char, updating state
+        return(s.encode('ascii','replace'))         # text might contain Unicode, get clean ASCII as bytes
+
+    #
+    #    _convert  --  word wrap if requested, then prepare and encode
+    #
+    #   Wrapping starts from the given column, and stops one short of the
+    #   carriage width, so the automatic CR at the margin never adds a blank line.
+    #
+    #   Returns (baudotbytes, finalshift, finalcol, shiftssaved)
+    #
+    def _convert(self, s, shift, col, wrap) :
+        if wrap :                                   # if word wrapping
+            wrapcol = col or 0                      # if column unknown, encoder starts a new line
+            s = '\n'.join(wraplines(s, wrapcol, self.outputcolmax-1, nonspacing=self.conv.nonspacing))
+        return(self._encode(self._prepare(s), shift, col))
+
+    #
+    #    _encode  --  convert ASCII bytes to Baudot, starting from the given machine state
+    #
+    #   Returns (baudotbytes, finalshift, finalcol, shiftssaved)
+    #
+    def _encode(self, s, shift, col) :
+        if self.optimizeshifts :                    # if sending as few shifts as possible
+            return(self.conv.encodeoptimized(s, shift, col, self.outputcolmax,
+                self.eolextralf, self.eolextraltrs, self.unshiftonspace))
+        (bs, shift, col) = self.conv.encode(s, shift, col, self.outputcolmax,
+            self.eolextralf, self.eolextraltrs, self.unshiftonspace)
+        return(bs, shift, col, 0)
+
+    #
+    #    estimate_print_seconds  --  time it would take to print a string, without printing it
+    #
+    #   Counts the chars actually sent, including shifts, end of line sequences, and
+    #   automatic CRs at the right margin, starting from the current machine state.
+    #   Includes motor start time if the motor is off.  Does not include output
+    #   already waiting to print; see "outwaitingtime" for that.
+    #
+    def estimate_print_seconds(self, s, wrap=False) :
+        if len(s) == 0 :                            # nothing to print
+            return(0.0)
+        with self.lock :
+            (bs, shift, col, saved) = self._convert(s, self.outputshift, self.outputcol, wrap)  # what would be sent
+            secs = len(bs) * self.charsecs          # time to send it
+            if not self.motoron :                   # if motor would have to start
+                secs += self.motorstartdelay
+        return(secs)
+
+    #
+    #    render  --  convert a string to Baudot ahead of printing it
+    #
+    #   Starts from the machine state at the end of "after", a previously rendered
+    #   string which will print just before this one, or from the current state.
+    #   If "wrap" is true, the string is word wrapped starting from that column.
+    #   Returns a Rendered object for "printrendered".
+    #
+    def render(self, s, after=None, wrap=False) :
+        with self.lock :
+            if after is None :                      # if printing next
+                (shift, col) = (self.outputshift, self.outputcol)
+            else :                                  # printing after something else
+                (shift, col) = (after.endshift, after.endcol)
+            (bs, endshift, endcol, saved) = self._convert(s, shift, col, wrap)
+        return(Rendered(s, wrap, shift, col, bs, endshift, endcol, saved))
+
+    #
+    #    printrendered  --  print a string rendered with "render"
+    #
+    #   If the machine state is not what the rendering assumed, because something else
+    #   was printed or a BREAK reset it, the string is wrapped and converted again.
+    #   The Baudot is written in small pieces so that a BREAK can stop it.
+    #   With paced output, each piece is waited for until released to the
+    #   port, so on return the string has been printed, apart from the
+    #   last "leadsecs" or so.
+    #   Returns the number of shift chars saved by optimization for this string.
+    #
+    def printrendered(self, r) :
+        bs = b''                                    # Baudot to send
+        saved = 0                                   # shift chars saved by optimization
+        with self.lock :
+            if len(r.text) > 0 and not self.kybdinterrupt :  # if something to print
+                self.motor(True)                    # turn on motor if needed
+                if (self.outputshift, self.outputcol) == (r.startshift, r.startcol) :  # if rendered for this state
+                    (bs, self.outputshift, self.outputcol, saved) = (r.data, r.endshift, r.endcol, r.saved)
+                else :                              # state changed, convert again
+                    (bs, self.outputshift, self.outputcol, saved) = self._convert(r.text, 
+                        self.outputshift, self.outputcol, r.wrap)
+        for i in range(0, len(bs), kwritechunk) :   # write in pieces
+            with self.lock :
+                if self.kybdinterrupt :             # if interrupted
+                    break                           # stop typing
+                self._writeser(bs[i:i+kwritechunk]) # write, updating print time estimate
+            if self.writer :                        # if paced output
+                self.writer.drain()                 # wait, unlocked, until sent or flushed
         with self.lock :                            # critical section for kybd check
             if self.kybdinterrupt :                 # if keyboard interrupt
                 self.kybdinterrupt = False          # clear keyboard interrupt
                 raise BaudotKeyboardInterrupt("Typing aborted")    # abort output
+        return(saved)                               # shift chars saved for this job
+
+    #
+    #    doprint --  print string to serial port, with appropriate conversions
+    #
+    #   The whole string is converted to Baudot in one pass, then written
+    #   in small pieces so that a BREAK can stop it.
+    #   If "wrap" is true, the string is word wrapped starting at the current column.
+    #
+    def doprint(self, s, wrap=False) :
+        self.printrendered(self.render(s, wrap=wrap))   # convert and print
                 
     #
     #   convertnonbaudot  --  convert characters not printable in Baudot to reasonable equivalents.
     #
-    re2 = re.compile(r'[\[\{\<]')                   # convert all left bracket types to (
-    re3 = re.compile(r'[\]\}\>]')                   # convert all right bracket types to )
-    re4 = re.compile(r'%')                          # convert all % to " pct."
-    re5 = re.compile(r'[|_]')                       # convert '| and "_' to "-"
-    
-    #   For FRACTIONS set only
-    re6 = re.compile(r'[\.!]')                      # convert "." and "!" to " # # #"
-    re7 = re.compile(r'[():;,]')                    # convert most other punct to  to " -- "
-
     #    The Baudot table converts unknown characters to "?".  This is more generous.
+    #    One pass, using a table built for the character set in use.
     #
     def convertnonbaudot(self, s) :
         """
         Convert characters not expressible in current char set to something more useful.
         """
-        charset = self.conv.getcharset()            # get character set in use
-        s = BaudotTTY.re2.sub('(',s)                # convert all left bracket types to (
-        s = BaudotTTY.re3.sub(')',s)                # convert all right bracket types to )
-        s = BaudotTTY.re4.sub(' pct.',s)            # spell out % abbrev, not in Baudot
-        s = BaudotTTY.re5.sub('-',s)                # underscore and vertical bar to hyphen
-        if charset == "FRACTIONS" :                 # if FRACTIONS charset, limited punct.
-            s = BaudotTTY.re6.sub(" # # # ",s)      # stops
-            s = BaudotTTY.re7.sub(" -- ",s)         # other punctuation
-        return(s)
+        return(s.translate(self.conv.translatetab))
         
+#
+#    class BaudotWriter  --  paced output thread
+#
+#    The USB to serial converter will hold many seconds of output, which
+#    can't be stopped by a BREAK.  So output is released to the serial
+#    port only as fast as the Teletype prints it, keeping no more than
+#    "leadsecs" of output ahead of the printer.  Writes don't block;
+#    "drain" waits for output to be released.
+#
+class BaudotWriter(threading.Thread) :
+    def __init__(self, ser, charsecs, leadsecs) :
+        threading.Thread.__init__(self)             # initialize base class
+        self.ser = ser                              # serial port
+        self.charsecs = charsecs                    # time to print one char
+        self.leadsecs = leadsecs                    # max output ahead of printer
+        self.pending = bytearray()                  # output not yet released
+        self.wireend = time.time()                  # when released output will finish printing
+        self.cond = threading.Condition()           # lock, and wakeup for writer
+        self.aborting = False                       # not yet aborting
+        self.daemon = True                          # don't let writer survive control-C
+
+    def write(self, s) :                            # queue output, does not block
+        with self.cond :
+            self.pending += s                       # add to unreleased output
+            self.cond.notify_all()                  # wake writer
+
+    def drain(self) :                               # wait until all output released, or flushed
+        with self.cond :
+            while len(self.pending) > 0 and not self.aborting :
+                self.cond.wait()
+
+    def flush(self) :                               # discard unreleased output
+        with self.cond :
+            del self.pending[:]                     # unreleased output is gone
+            self.ser.flushOutput()                  # and the little bit in the device, if it can
+            self.cond.notify_all()                  # wake writer and anyone draining
+
+    def outwaitingtime(self) :                      # time left to print
+        with self.cond :
+            return(len(self.pending) * self.charsecs + max(0.0, self.wireend - time.time()))
+
+    def abort(self) :                               # stop writer thread
+        with self.cond :
+            self.aborting = True
+            self.cond.notify_all()
+        self.join(10.0)                             # wait for thread to finish
+
+    def run(self) :
+        with self.cond :
+            while not self.aborting :               # until told to stop
+                if len(self.pending) == 0 :         # if nothing to send
+                    self.cond.wait()                # wait for output
+                    continue
+                now = time.time()
+                self.wireend = max(self.wireend, now)   # printer idle if output all printed
+                room = int((now + self.leadsecs - self.wireend) / self.charsecs + 0.5)  # chars we can release
+                if room < 1 and self.wireend <= now :   # always at least one char when idle
+                    room = 1
+                if room < 1 :                       # printer is far enough behind
+                    self.cond.wait(self.wireend - self.leadsecs + 0.5*self.charsecs - now) # until one char fits
+                    continue
+                s = bytes(self.pending[:room])      # release this much
+                del self.pending[:room]
+                self.wireend += len(s) * self.charsecs  # printer busy until then
+                self.ser.write(s)                   # small write, does not block for long
+                if len(self.pending) == 0 :         # all released
+                    self.cond.notify_all()          # wake anyone draining
+
+#
+#    class Spooler  --  print spooler thread
+#
+#    Prints jobs from a bounded queue on its own thread, so the caller can
+#    prepare the next job while this one prints.  A BREAK cancels the job
+#    being printed and all jobs queued behind it.  The caller finds out at
+#    its next "submit", "wait", or "check", which raise BaudotKeyboardInterrupt.
+#
+class Spooler(threading.Thread) :
+    def __init__(self, tty, maxjobs=kspoolermaxjobs) :
+        threading.Thread.__init__(self)             # initialize base class
+        self.tty = tty                              # BaudotTTY to print on
+        self.jobs = queue.Queue(maxjobs)            # jobs waiting to print
+        self.cond = threading.Condition()           # lock, and wakeup when jobs finish
+        self.pending = 0                            # jobs submitted and not finished
+        self.pendingsecs = 0.0                      # print time of jobs not yet started
+        self.lastrendered = None                    # last job submitted, already converted to Baudot
+        self.interrupted = False                    # a BREAK cancelled output
+        self.error = None                           # exception while printing, for caller
+        self.aborting = False                       # external request to terminate
+        self.daemon = True                          # don't let spooler survive control-C
+
+    def submit(self, s, donecallback=None, wrap=False) :
+        """
+        Queue a string for printing.  Blocks if the queue is full.
+
+        The string is converted to Baudot here, on the caller's thread,
+        starting from where the previous job will leave the machine,
+        so the spooler thread only has to send it.  If "wrap" is true,
+        it is also word wrapped starting from that column.
+
+        "donecallback(completed, saved)" is called from the spooler thread
+        when the job has been printed, or cancelled by a BREAK.  "saved" is
+        the number of shift chars this job saved by optimization.
+        """
+        self.check()                                # report any cancel or error
+        with self.cond :
+            after = None                            # if idle, start from current machine state
+            if self.pending > 0 :                   # if other jobs ahead of this one
+                after = self.lastrendered           # start where they will leave off
+        r = self.tty.render(s, after, wrap)         # convert to Baudot now
+        with self.cond :
+            self.lastrendered = r
+            self.pending += 1                       # one more job outstanding
+            self.pendingsecs += len(r.data) * self.tty.charsecs
+        self.jobs.put((r, donecallback))            # blocks if queue full
+
+    def waitforjob(self, timeout=None) :
+        """
+        Wait until a job finishes, or timeout.
+        """
+        with self.cond :
+            if self.pending > 0 :                   # if anything to wait for
+                self.cond.wait(timeout)
+        self.check()                                # report any cancel or error
+
+    def wait(self) :
+        """
+        Wait until everything submitted has been printed or cancelled.
+        """
+        with self.cond :
+            while self.pending > 0 :                # until all jobs done
+                self.cond.wait()
+        self.check()                                # report any cancel or error
+
+    def idle(self) :                                # true if nothing queued or printing
+        with self.cond :
+            return(self.pending == 0)
+
+    def backlogsecs(self) :                         # estimated time to print everything submitted
+        with self.cond :
+            pendingsecs = self.pendingsecs
+        return(pendingsecs + self.tty.outwaitingtime())
+
+    def check(self) :
+        """
+        Raise BaudotKeyboardInterrupt if a BREAK cancelled output since the
+        last check, or any exception raised while printing.  After a BREAK,
+        waits until the cancelled jobs have been discarded.
+        """
+        with self.cond :
+            if self.error :                         # printing failed
+                error = self.error
+                self.error = None
+                raise error                         # reraise here
+            if self.interrupted :                   # if BREAK
+                while self.pending > 0 :            # wait for cancelled jobs to go away
+                    self.cond.wait()
+                self.interrupted = False            # cancel is over
+                raise BaudotKeyboardInterrupt("Typing aborted")
+
+    def abort(self) :                               # terminate spooler thread
+        if not self.is_alive() :                    # if not started
+            return                                  # no problem
+        self.aborting = True                        # abort at next queue timeout
+        self.join(10.0)                             # wait for thread to finish
+        if self.is_alive() :
+            raise RuntimeError("INTERNAL ERROR: print spooler will not terminate.  Kill program.")
+
+    def run(self) :
+        while not self.aborting :                   # until told to stop
+            try :
+                (r, donecallback) = self.jobs.get(True, 1.0)  # get next job
+            except queue.Empty :                    # if none
+                continue
+            completed = False
+            saved = 0                               # shift chars saved by this job
+            with self.cond :
+                self.pendingsecs = max(0.0, self.pendingsecs - len(r.data) * self.tty.charsecs)
+            try :
+                if not (self.interrupted or self.error) : # unless cancelling
+                    saved = self.tty.printrendered(r)   # print, blocking
+                    completed = True
+                if donecallback :                   # tell submitter
+                    donecallback(completed, saved)
+            except BaudotKeyboardInterrupt :        # BREAK, cancel this and all queued jobs
+                with self.cond :
+                    self.interrupted = True
+                if donecallback :                   # tell submitter
+                    donecallback(False, 0)
+            except Exception as message :           # trouble, pass to caller
+                with self.cond :
+                    self.error = message
+            with self.cond :
+                self.pending -= 1                   # job done
+                self.cond.notify_all()              # wake anyone waiting
+
 #
 #    Non-class utility functions
 #
+#
+#    wraplines  --  word wrap a string, one output line at a time
+#
+#    A generator, so long bodies are wrapped in linear time and can be
+#    joined or printed without building intermediate strings.
+#    "startcol" is where the carriage is when printing starts; the first
+#    line yielded is the rest of that line.  Characters in "nonspacing",
+#    such as BELL, don't move the carriage and aren't counted.
+#    "maxword" is the maximum word length which will never be split.
+#
+def wraplines(s, startcol=0, maxline=64, maxword=15, nonspacing="") :
+    s = re1a.sub('',s)                              # remove all CR, to avoid position counting problems
+    col = min(max(startcol, 0), maxline)            # column at start of first line
+    nonspacing = frozenset(nonspacing)
+    for line in s.split('\n') :                     # for each line
+        pos = 0                                     # start of unprinted part of line
+        linenonspacing = None                       # usual case, all chars move the carriage
+        if not nonspacing.isdisjoint(line) :        # if some don't
+            linenonspacing = nonspacing             # count them the slow way
+        while True :
+            end = _spacingindex(line, pos, maxline - col, linenonspacing)  # index of first char past margin
+            if end >= len(line) :                   # if rest of line fits
+                break
+            ix = line.rfind(' ', max(pos, end-maxword), end+1)    # find space at which to break
+            if ix > pos :                           # if reasonable break point
+                yield(line[pos:ix])                 # take part of line before space
+                pos = ix + 1                        # part of line after space
+            elif col > 0 :                          # if partway across the carriage
+                yield('')                           # start a new line, then try again
+            else :                                  # no break point in a whole line
+                yield(line[pos:end])                # take part of line before break
+                pos = end                           # part of line after break
+            col = 0                                 # now at start of line
+        yield(line[pos:])                           # remainder of line
+        col = 0
+
+#
+#    _spacingindex  --  index in line after "count" carriage-moving chars from "pos"
+#
+def _spacingindex(line, pos, count, nonspacing) :
+    if not nonspacing :                             # every char moves the carriage
+        return(pos + count)
+    for i in range(pos, len(line)) :                # count spacing chars
+        if line[i] not in nonspacing :
+            if count <= 0 :                         # this one would be past the margin
+                return(i)
+            count -= 1
+    return(len(line))                               # whole rest of line fits
+
 #
 #    wordwrap  --  basic word wrap for strings
 #
 #    The default width is 64, just before a Model 15 teletype rings the margin bell.
-#    "maxword" is the maximum word length which will never be split.
+#    For printing, use the "wrap" option of "doprint", which knows the carriage
+#    position and width.
 #
 def wordwrap(s, maxline=64, maxword=15) :
-    s = re1a.sub('',s)                              # remove all CR, to avoid position counting problems
-    lines = s.split('\n')                           # split into individual lines
-    outlines = []                                   # output lines
-    for line in lines :                             # for each line
-        sline = ''
-        while len(line) > maxline :                 # while line too long
-            ix = line.rfind(' ',maxline-maxword,maxline)    # find space at which to break
-            if ix < 1 :                             # if no reasonable break point
-                sline += line[0:maxline] + '\n'     # take part of line before break
-                line = line[maxline:]               # part of line after break
-            else: 
-                sline += line[0:ix] + '\n'          # take part of line before space
-                line = line[ix+1:]                  # part of line after space
-        sline += line                               # accum remainder of line
-        outlines.append(sline)                      # next line
-    return('\n'.join(outlines))                     # rejoin lines
+    return('\n'.join(wraplines(s, 0, maxline, maxword)))    # rejoin lines
@@ -14,6 +14,7 @@ import baudot
 import threading
 import sys
 import os
+import re
 #
 #   Constants
 #
@@ -24,6 +25,9 @@ CTLC = 0x03                                         # control-C
 #   Baudot
 BLANKKEY = 0x00                                     # the all ones char in Baudot     
 
+#   Regular expressions
+reeol = re.compile(r'[\r\n]')                         # CR or LF ends a line
+
 class Getch:
     """
     Gets a single character from standard input.  
@@ -105,21 +109,14 @@ class Dummyteletype(object) :                       # really should inherit from
         """
         Write to dummy teletype. Input is Baudot as type bytes
         """
-        for bb in s :                               # for Baudot bytes
-            if bb == baudot.Baudot.FIGS :           # if FIGS shift
-                self.outshift = bb
-                continue
-            if bb == baudot.Baudot.LTRS :           # if LTRS shift
-                self.outshift = bb
-                continue
-            ch = self.baudot.chToASCII(bb, self.outshift) # convert to ASCII            
-            ####self.logger.info("Output as Baudot: %s <- %d (shift %s)" % (ch, bb, self.outshift))  # ***TEMP***
-            if not ch is None :                 
-                if ch in ['\n','\r'] :
-                    self.flushOutput()              # display if anything available
-                else :
-                    with self.flushlock:            # critical section
-                        self.outline = self.outline + ch # add to output line
+        (text, self.outshift) = self.baudot.decode(s, self.outshift) # convert to ASCII
+        lines = reeol.split(text)                   # split at CR and LF
+        for i in range(len(lines)) :
+            if i > 0 :                              # at CR or LF
+                self.flushOutput()                  # display if anything available
+            if len(lines[i]) > 0 :
+                with self.flushlock:                # critical section
+                    self.outline = self.outline + lines[i] # add to output line
         self.inshift = self.outshift                # keep both sides in sync
         #   If no output has been sent for 0.5 secs, flush the output buffer.
         #   This gets us full lines of output.
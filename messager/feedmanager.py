@@ -18,16 +18,33 @@ import re
 import time
 import datetime
 import types
-from six.moves import queue
 from six.moves import urllib
 import threading
 import hashlib
+import heapq
+import math
+import collections
 import msgutils
 import bs4
 #
 #   Constants
 #
 MINERRMSGINTERVALSECS = 120.0            # minimum interval between error msgs
+#
+#   Priority classes for the merged item queue.  Lower numbers print first.
+#
+PRIORITYEXCEPTION = 0                   # feed thread failed, shut down promptly
+PRIORITYSMS = 1                         # messages to people
+PRIORITYERROR = 2                       # error reports from any feed
+PRIORITYNEWS = 3                        # news stories
+#
+#   Format levels, for printing less when far behind.
+#
+FORMATFULL = 0                          # everything
+FORMATPARAGRAPH = 1                     # headline and first paragraph
+FORMATHEADLINE = 2                      # headline only
+FORMATSKIP = 3                          # don't print at all
+FORMATNAMES = ["full", "paragraph", "headline", "skip"]
 
 #
 #   isstring -- true if a string, for Python 2.7 and 3.x
@@ -57,6 +74,7 @@ class FeedItem(object) :
         self.subject = subject                          # subject, if source has subjects
         self.body = body                                # body text
         self.errmsg = errmsg                            # error message if any
+        self.timestamp = time.time()                    # time of item, for ordering; feed may set
         self.calcdigest()                               # calculate message digest, for duplicate removal
 
     def setnote(self, msgdeliverynote) :                # set DELIVERY NOTE field
@@ -83,8 +101,8 @@ class FeedItem(object) :
         return(hdr)
 
 
-    def formattext(self) :                              # return long formatted version of content
-        return(self.feed.formattext(self))              # use feed-specific format
+    def formattext(self, level=FORMATFULL) :            # return long formatted version of content
+        return(self.feed.formattext(self, level))       # use feed-specific format, shortened if requested
 
     def summarytext(self) :                             # return item summary
         return(self.feed.summarytext(self))
@@ -96,8 +114,7 @@ class FeedItem(object) :
         """
         Indicate done (printed, sent, etc.) with item.
         
-        Only one item per feed can be outstanding (obtained with getitem, but not done)
-        at a time.
+        Items obtained with getitem are outstanding until done.
         """
         self.feed.itemdonebase(self)                    # item will not be returned again after a crash
 
@@ -113,21 +130,39 @@ class Feed(threading.Thread) :
     Feed --  base class for all feeds
     """
     kidleinterval = 60.0                                # if no item request for this long, stop polling
+    krecheckinterval = 5.0                              # if items waiting, check this often
     #    Called from outside thread
     def __init__(self, feedtype, logger) :
         threading.Thread.__init__(self)                 # initialize base class
         self.logger = logger                            # logger object
         self.feedtype = feedtype                        # "NEWS" or "SMS"
-        self.inqueue = queue.Queue()                    # input queue
         self.aborting = False                           # not yet aborting
         self.lastpoll = 0.0                             # no last poll yet
-        self.lastget = time.time()                      # last get request
         self.header = None                              # no special header
         self.trailer = None                             # no special trailer
         self.lasterrmsg = ""                            # for error undup
         self.lasterrtime = 0                            # last error time
-        self.lastitem = None                            # last item returned
+        self.outstanding = set()                        # items returned but not yet done
+        self.owner = None                               # Feeds object which queues our items
+        self.queued = 0                                 # items in owner's queue
+        self.queuedheld = 0                             # of those, news which the print budget may hold
+        self.queuedchars = 0                            # their length, fully formatted
+        self.generation = 0                             # owner's queue entries from older generations are dropped
+        self.weight = 1.0                               # share of printing relative to other feeds
+        self.lasttag = 0.0                              # fair queuing tag of last item queued
+        self.wakeevent = threading.Event()              # set to wake the feed thread
+        self.onwake = None                              # also called on wakeup, if a scheduler runs us
         
+    def setweight(self, weight) :                       # share of printing relative to other feeds
+        """
+        Set this feed's share of printing.  A feed of weight 2 gets twice
+        the turns of a feed of weight 1 when both have news waiting, and
+        with a print budget its stories are worth twice as much.
+        """
+        if not weight > 0.0 :
+            raise ValueError('Feed weight must be more than 0, not %s.' % (weight,))
+        self.weight = float(weight)
+
     def setheaders(self, header, trailer) :
         """
         Set header and trailer for display.
@@ -142,6 +177,7 @@ class Feed(threading.Thread) :
             self.logger.debug('Not running feed "%s"' % (self.feedtype,))
             return                                  # no problem.
         self.aborting = True                        # abort this task at next read timeout
+        self.wake()                                 # stop waiting for next poll
         self.join(20.0)                             # wait for thread to finish
         if self.is_alive() :
             raise RuntimeError('INTERNAL ERROR: "%s" feed thread will not terminate.  Kill program.' % (self.gettitle(),))
@@ -149,27 +185,13 @@ class Feed(threading.Thread) :
             self.logger.debug('Shut down feed "%s"' % (self.feedtype,))
 
 
-    def getitem(self) :                                 # get a queue item - called every few seconds
-        assert(self.lastitem == None)                   # an item is in use - should not call
-        if not self.is_alive() :                        # if thread not running
-            raise RuntimeError('Feed "%s" reader has failed.' % (self.gettitle(),))    # fail caller, so program will shut down
-        self.lastget = time.time()                      # time of last get request, for idle check
-        try: 
-            item = self.inqueue.get_nowait()            # get input if any
-            if isinstance(item, Exception) :            # if item is an exception, thread raised an exception
-                raise item                              # raise exception to force shutdown
-            self.lastitem = item                        # item currently being worked on 
-            return(item)                                # otherwise just return item
-        except queue.Empty:                             # if empty
-            return(None)                                # done
-            
     def itemdonebase(self, item) :
         """
-        Note that the one outstanding item is done.
+        Note that an outstanding item is done.
         """
-        assert(self.lastitem == item)                   # must be valid item
+        assert(item in self.outstanding)                # must be valid item
         self.itemdone(item)                             # call in subclass 
-        self.lastitem = None                            # no item active now
+        self.outstanding.discard(item)                  # no longer active
         
     def itemdone(self) :
         raise(RuntimeError("itemdone unimplemented"))   # must override in subclass
@@ -178,12 +200,42 @@ class Feed(threading.Thread) :
         """
         True if feed is idle - nothing being printed, and nothing queued.
         """
-        return(self.lastitem is None and self.inqueue.empty())  # nothing going on?  
+        return(not self.outstanding and self.queued == 0)  # nothing going on?  
 
     def forcepoll(self) :                               # force an immediate poll
-        self.lastpoll = 0.0                             # in a few seconds
+        self.lastpoll = 0.0                             # poll is due
+        self.wake()                                     # now
+
+    def wake(self) :                                    # stop waiting, check whether a poll is due
+        self.wakeevent.set()
+        if self.onwake :                                # if run by a FeedScheduler or FetchPool
+            self.onwake()
+
+    def gethost(self) :                                 # host polled, for per-host limits, or None
+        return(None)
+
+    def queueitem(self, item) :
+        """
+        Queue an item or exception for the main task, and wake it up.
+        """
+        self.owner.queueitem(self, item)                # add to merged output queue
 
-    def formattext(self, item) :                        # default formatting, can override
+    def drainqueue(self) :
+        """
+        Discard all our items not yet returned by getitem.
+        """
+        self.owner.drainqueue(self)
+
+    def getpriority(self, item) :                       # priority class for an item
+        if isinstance(item, Exception) :                # thread failed
+            return(PRIORITYEXCEPTION)
+        if item.errmsg :                                # error report
+            return(PRIORITYERROR)
+        if self.feedtype == "SMS" :                     # message
+            return(PRIORITYSMS)
+        return(PRIORITYNEWS)
+
+    def formattext(self, item, level=FORMATFULL) :      # default formatting, can override
         if item.errmsg :
             return("ERROR: " + item.errmsg)
         return(item.body)                               # otherwise body
@@ -193,31 +245,50 @@ class Feed(threading.Thread) :
         
 
     #    Called from within thread
+    #
+    #    The thread sleeps until the next poll is due, or until woken by
+    #    "forcepoll", "abort", or a request for items after an idle period.
+    #
     def run(self) :                                      # working thread
         try:
             while not self.aborting :                    # until killed
-                self.dopoll()                            # do a poll cycle
-                time.sleep(5.0)                          # wait at least 5 secs
+                self.wakeevent.clear()                   # wakeups from here on end the wait
+                delay = self.dopoll()                    # do a poll cycle
+                if not self.aborting :
+                    self.wakeevent.wait(delay)           # wait for next poll or wakeup
             self.logger.debug('Feed "%s" shutting down.' % (self.gettitle(),))    # note abort
         except Exception as message :                    # if trouble
             self.logger.exception('Feed "%s" exception: %s' % (self.gettitle(), str(message)))
-            self.inqueue.put(message)                    # queue exception for main task and exit
-
+            self.queueitem(message)                      # queue exception for main task and exit
+
+    #
+    #    dopoll  --  do one poll cycle, if one is due
+    #
+    #    Returns seconds until the next poll cycle is needed, or None if there
+    #    is nothing to do until woken.
+    #
     def dopoll(self) :                                   # do one poll cycle
-        if not self.inqueue.empty() :                    # if data available
-            return                                       # nothing to do    
+        delay = self.polldelay()                         # is a poll due?
+        if delay is None or delay > 0.0 :                # if not yet
+            return(delay)
+        return(self.pollnow())                           # time to do a poll
+
+    def polldelay(self) :                                # seconds until poll due, 0 if now, None if idle
+        if self.owner.readycount(self) > 0 :             # if data available to print now
+            return(self.krecheckinterval)                # nothing to do until it is taken
         now = time.time()                                # time now
         timetopoll = self.getpollinterval() - (now - self.lastpoll)    # seconds untl next poll
-        if now - self.lastget > self.kidleinterval :     # if nobody wants data (Teletype not running)
+        if not self.owner.iswanted(now) :                # if nobody wants data (Teletype not running)
             self.logger.debug("Off, no poll.")
-            return                                       # nothing to do
+            return(None)                                 # nothing to do until asked for items
         self.logger.debug("Next %s (%s) poll in %1.1fs." % (self.feedtype, self.gettitle(), timetopoll))
-        if timetopoll >= 0.0 :                           # if too soon
-            return
-        #    Time to do a poll
+        return(max(timetopoll, 0.0))
+
+    def pollnow(self) :                                  # poll, returns seconds until next poll
         self.logger.info("Polling %s (%s)" % (self.feedtype, self.gettitle(),))
         self.fetchitems()                                # ask feed for some items
         self.lastpoll = time.time()                      # wait a full poll interval before asking again
+        return(self.getpollinterval())
         
     def calcdigest(self, item) :                 
         """
@@ -247,13 +318,13 @@ class Feed(threading.Thread) :
             timesinceerror = time.time() - self.lasterrtime
             if timesinceerror < MINERRMSGINTERVALSECS :
                 return                          # don't print too often
-        if self.inqueue.empty () :              # if nothing queued
+        if self.queued == 0 :                   # if nothing queued
             timenow = datetime.datetime.now()   # timestamp
             newitem = FeedItem(self, None, 
                 msgutils.editdate(timenow), 
                 msgutils.edittime(timenow), 
                 None, None, errmsg)
-            self.inqueue.put(newitem)           # add to output queue
+            self.queueitem(newitem)             # add to output queue
             self.lasterrtime = time.time()      # record err printed
             self.lasterrmsg = errmsg
             
@@ -280,15 +351,292 @@ class Feed(threading.Thread) :
         except EnvironmentError as message :
             return(str(message))                            # trouble
                                     
+#
+#    class PollInterval  --  adaptive poll interval for one feed
+#
+#    Polls about twice per expected new item, from an exponentially weighted
+#    moving average of the time between new items.  Each poll that finds
+#    nothing new backs off.  A server hint (Cache-Control, Expires,
+#    Retry-After, RSS "ttl") delays the next poll at least that long.
+#    All within minsecs..maxsecs.
+#
+class PollInterval(object) :
+    kalpha = 0.3                                        # weight of newest gap in average
+    kfraction = 0.5                                     # poll this fraction of average gap
+    kbackoff = 1.5                                      # stretch interval by this when nothing new
+    def __init__(self, initialsecs, minsecs, maxsecs) :
+        self.minsecs = minsecs
+        self.maxsecs = maxsecs
+        self.interval = initialsecs                     # current interval, before hint
+        self.avggap = None                              # average secs between new items, once known
+        self.lastarrival = None                         # time of last poll with new items
+        self.hintsecs = 0.0                             # server's minimum wait before next poll
+
+    def setbounds(self, minsecs, maxsecs) :
+        self.minsecs = minsecs
+        self.maxsecs = maxsecs
+        self.interval = self.clamp(self.interval)
+
+    def clamp(self, secs) :
+        return(min(max(secs, self.minsecs), self.maxsecs))
+
+    def arrived(self, count, now, hintsecs=0.0) :       # poll found "count" new items
+        if self.lastarrival is not None :               # gap since last arrival, per item
+            gap = (now - self.lastarrival) / count
+            if self.avggap is None :
+                self.avggap = gap
+            else :
+                self.avggap = self.kalpha * gap + (1.0 - self.kalpha) * self.avggap
+            self.interval = self.clamp(self.avggap * self.kfraction)
+        self.lastarrival = now
+        self.hintsecs = hintsecs
+
+    def nochange(self, hintsecs=0.0) :                  # poll found nothing new, or failed
+        self.interval = self.clamp(self.interval * self.kbackoff)
+        self.hintsecs = hintsecs
+
+    def getinterval(self) :                             # seconds from last poll to next
+        return(max(self.interval, min(self.hintsecs, self.maxsecs)))
+
+#
+#    class PrintBudget  --  limit on news printing time per rolling window
+#
+#    The printer, not the network, is the bottleneck.  News items are charged
+#    their estimated print time, and only "budgetsecs" of news are printed in
+#    any "windowsecs".  Items are chosen by value per second of printing, where
+#    value is the feed weight, halved for every "halflifesecs" of age.  Since
+#    every item ages at the same rate, the ordering between items never changes,
+#    and the choice can be made with a heap.  Items older than "maxagesecs",
+#    or too long to ever fit, are dropped.
+#
+class PrintBudget(object) :
+    def __init__(self, windowsecs, budgetsecs, halflifesecs, maxagesecs, charsecs) :
+        self.windowsecs = windowsecs                    # rolling window
+        self.budgetsecs = budgetsecs                    # news print time allowed per window
+        self.halflifesecs = halflifesecs                # value halves with this much age
+        self.maxagesecs = maxagesecs                    # older items are dropped
+        self.charsecs = charsecs                        # time to print one char
+        self.printed = collections.deque()              # (time, secs) charged in window, oldest first
+
+    def cost(self, item) :                              # estimated print time of item, seconds
+        return(max(1, item.printchars) * self.charsecs)
+
+    def rank(self, weight, item) :                      # heap key, lower is better value per second
+        return(-(math.log(weight, 2.0) + item.timestamp / self.halflifesecs - math.log(item.printsecs, 2.0)))
+
+    def used(self, now) :                               # print time charged in the window
+        while self.printed and self.printed[0][0] <= now - self.windowsecs :  # drop charges outside window
+            self.printed.popleft()
+        return(sum(secs for (when, secs) in self.printed))
+
+    def charge(self, now, secs) :                       # item is being printed
+        self.printed.append((now, secs))
+
+    def stale(self, item, now) :                        # true if item should never be printed
+        return(now - item.timestamp > self.maxagesecs or item.printsecs > self.budgetsecs)
+
+    def waitsecs(self, item, now) :                     # time until item fits in budget, 0 if it fits now
+        available = self.budgetsecs - self.used(now)
+        for (when, secs) in self.printed :              # charges leave window, oldest first
+            if available >= item.printsecs :
+                break
+            available += secs
+            if available >= item.printsecs :            # fits when this charge expires
+                return(when + self.windowsecs - now)
+        return(0.0)
+
+#
+#    class FetchPool  --  poll all feeds with a fixed number of threads
+#
+#    Instead of a thread per feed, each feed's next poll goes in a heap ordered
+#    by time due, and "workers" threads take polls from it as they come due.
+#    Only one poll per host runs at a time, so a slow host holds up only its
+#    own feeds, and we don't get rate-limited.  Feeds due while their host is
+#    busy wait until it is free.
+#
+class FetchPool(object) :
+    kabortsecs = 20.0                                   # wait this long for polls to finish on abort
+    def __init__(self, logger, workers) :
+        self.logger = logger
+        self.cond = threading.Condition()               # lock, notified when something changes
+        self.due = []                                   # heap of (time due, seq, feed)
+        self.seq = 0                                    # order added, breaks ties
+        self.duetime = {}                               # feed -> time due, None if not scheduled
+        self.polling = set()                            # feeds being polled now
+        self.rewake = set()                             # woken while being polled
+        self.busyhosts = set()                          # hosts being polled now
+        self.hostwaiting = {}                           # host -> feeds due while host was busy
+        self.aborting = False
+        self.workers = [threading.Thread(target=self.run) for i in range(workers)]
+        for worker in self.workers :
+            worker.daemon = True                        # don't keep program alive
+            worker.start()
+
+    def addfeed(self, feed) :                           # start polling a feed
+        feed.onwake = lambda : self.wakefeed(feed)
+        self.wakefeed(feed)                             # check for poll now
+
+    def wakefeed(self, feed) :                          # check feed for poll now
+        with self.cond :
+            if feed.aborting :                          # failed or shut down
+                return
+            if feed in self.polling :                   # check again when current poll finishes
+                self.rewake.add(feed)
+                return
+            self.schedule(feed, time.time())
+
+    def schedule(self, feed, when) :                    # set time feed is next due, must hold lock
+        self.duetime[feed] = when                       # any older heap entry is now ignored
+        self.seq += 1
+        heapq.heappush(self.due, (when, self.seq, feed))
+        self.cond.notify()                              # a worker may want this sooner
+
+    def abort(self) :                                   # stop polling, wait for polls in progress
+        with self.cond :
+            self.aborting = True
+            for feed in self.duetime :
+                feed.aborting = True
+            self.cond.notify_all()
+        deadline = time.time() + self.kabortsecs
+        for worker in self.workers :
+            worker.join(max(deadline - time.time(), 0.0))
+            if worker.is_alive() :
+                raise RuntimeError('INTERNAL ERROR: feed fetch pool will not terminate.  Kill program.')
+        self.logger.debug("Feed fetch pool shut down.")
+
+    def takedue(self, now) :                            # get feed due for a poll, must hold lock
+        """
+        Returns (feed, None) for a feed to poll, or (None, seconds) to wait.
+        """
+        while self.due :
+            (when, seq, feed) = self.due[0]
+            if self.duetime.get(feed) != when :         # superseded by a later schedule
+                heapq.heappop(self.due)
+                continue
+            if when > now :                             # nothing due yet
+                return(None, when - now)
+            heapq.heappop(self.due)
+            host = feed.gethost()
+            if host is not None and host in self.busyhosts :    # one poll per host at a time
+                self.hostwaiting.setdefault(host, []).append((when, feed))
+                continue
+            self.duetime[feed] = None                   # not scheduled while being polled
+            self.polling.add(feed)
+            if host is not None :
+                self.busyhosts.add(host)
+            return(feed, None)
+        return(None, None)                              # nothing scheduled, wait for a wakeup
+
+    def polldone(self, feed, delay) :                   # poll finished, must hold lock
+        self.polling.discard(feed)
+        host = feed.gethost()
+        if host is not None :                           # host is free, its waiting feeds are due
+            self.busyhosts.discard(host)
+            for (when, waiting) in self.hostwaiting.pop(host, []) :
+                if self.duetime.get(waiting) == when :  # unless rescheduled meanwhile
+                    self.seq += 1
+                    heapq.heappush(self.due, (when, self.seq, waiting))
+        if feed in self.rewake :                        # woken during poll, check again now
+            self.rewake.discard(feed)
+            delay = 0.0
+        if delay is not None and not feed.aborting :    # unless idle until woken
+            self.schedule(feed, time.time() + delay)
+        self.cond.notify_all()
+
+    def run(self) :                                     # worker thread
+        while True :
+            with self.cond :
+                while True :
+                    if self.aborting :
+                        return
+                    (feed, waitsecs) = self.takedue(time.time())
+                    if feed :                           # got one to poll
+                        break
+                    self.cond.wait(waitsecs)            # wait until due or woken
+            delay = None                                # if poll fails, feed stops
+            try :
+                delay = feed.dopoll()                   # do a poll cycle
+            except Exception as message :               # if trouble
+                self.logger.exception('Feed "%s" exception: %s' % (feed.gettitle(), str(message)))
+                feed.queueitem(message)                 # queue exception for main task
+                feed.aborting = True                    # and stop polling this feed
+            with self.cond :
+                self.polldone(feed, delay)
+
+#
+#    class FormatLadder  --  print less of each news item when far behind
+#
+#    Steps down from full text to first paragraph, headline only, and skipping
+#    news entirely, as the estimated print time of the backlog passes each
+#    threshold.  Steps back up when the backlog drops below "recover" times
+#    the threshold of the current level, so it doesn't flap.
+#
+class FormatLadder(object) :
+    def __init__(self, paragraphsecs, headlinesecs, skipsecs, recover, logger) :
+        self.thresholds = [None, paragraphsecs, headlinesecs, skipsecs]  # backlog to enter level, None for never
+        self.recover = recover                          # fraction of threshold at which to step back up
+        self.logger = logger
+        self.level = FORMATFULL                         # current level
+
+    def update(self, backlogsecs) :                     # new backlog estimate, returns level
+        target = FORMATFULL                             # level for this backlog
+        for level in range(FORMATPARAGRAPH, FORMATSKIP+1) :
+            if self.thresholds[level] is not None and backlogsecs > self.thresholds[level] :
+                target = level
+        level = self.level
+        if target > level :                             # falling behind, step down at once
+            level = target
+        while level > target and backlogsecs < self.thresholds[level] * self.recover :  # caught up enough
+            level = max([l for l in range(FORMATFULL, level)
+                if l == FORMATFULL or self.thresholds[l] is not None])  # next level up in use
+        if level != self.level :                        # if changed
+            self.logger.info("Backlog %1.0f minutes, news format %s -> %s." % 
+                (backlogsecs / 60.0, FORMATNAMES[self.level], FORMATNAMES[level]))
+            self.level = level
+        return(level)
+
 #
 #    class Feeds  --  handle multiple news feeds
 #
+#    Items from all feeds go into one priority queue, a heap.  Items are ordered
+#    by priority class (exceptions, SMS, errors, news), then by a weighted fair
+#    queuing tag, so a busy feed takes turns with the others instead of starving
+#    them, then newest first, then order of arrival.
+#    With a print budget, news items are ordered by value per second of
+#    printing instead, and held while the budget is used up.
+#
 class Feeds(object) :
+    kpurgesecs = 10.0                                   # look for expired news in whole queue this often
     def __init__(self, logger) :
         self.logger = logger                            # logging object
         self.feeds = []                                 # no feeds yet
         self.lasttitle = None                           # no last title
+        self.cond = threading.Condition()               # lock for queue, notified when any feed queues an item
+        self.wakeflag = False                           # true if "wakeup" called
+        self.queue = []                                 # heap of (priority, tag, -timestamp, seq, generation, feed, item)
+        self.seq = 0                                    # arrival order
+        self.vtime = 0.0                                # fair queuing virtual time, tag of last item returned
+        self.lastget = time.time()                      # last get request, for feed idle check
+        self.waiters = 0                                # "getitem" calls waiting for an item
+        self.queuedchars = 0                            # length of queued items, fully formatted
+        self.budget = None                              # PrintBudget for news, if any
+        self.budgetwait = None                          # seconds until held news item fits budget
+        self.lastpurge = 0.0                            # last look for expired news in whole queue
+        self.scheduler = None                           # FeedScheduler or FetchPool polling all feeds, if any
         
+    def setbudget(self, budget) :
+        """
+        Limit news printing time.  Set before adding feeds.
+        """
+        self.budget = budget
+
+    def setscheduler(self, scheduler) :
+        """
+        Poll all feeds from one FeedScheduler or FetchPool instead of a thread per feed.
+        Set before adding feeds.
+        """
+        self.scheduler = scheduler
+
     def feedcount(self) :
         """
         Number of feeds
@@ -297,21 +645,170 @@ class Feeds(object) :
 
     def addfeed(self, feed) :                           # add a feed
         self.feeds.append(feed)                         # add a feed
+        feed.owner = self                               # feed will notify us of new items
+        if self.scheduler :                             # if one scheduler polls all feeds
+            self.scheduler.addfeed(feed)                # start the feed running there
+            return
         feed.daemon = True                              # make feed a daemon, so it will abort if main does
         feed.start()                                    # start the feed running
 
     def abort(self) :                                   # abort all feeds
+        if self.scheduler :                             # feeds have no threads of their own
+            self.scheduler.abort()
+            return
         for feed in self.feeds :                        # tell all feeds to abort
             feed.abort()                                # if they don't, we will hang. 
         for feed in self.feeds :                        # wait for finish 
             feed.join()
 
-    def getitem(self) :                                 # get one item, from some feed
-        for feed in self.feeds :                        # try all feeds
-            item = feed.getitem()                       # get one item
-            if item :                                   # if got an item
-                return(item)                            # return it
-        return(None)                                    # no new items available
+    def getitem(self, timeout=0.0) :                    # get one item, from some feed
+        """
+        Get the highest priority item, from some feed.
+
+        Waits up to "timeout" seconds for an item to arrive.  None means
+        wait until one does.  Returns None on timeout, or if "wakeup" is called.
+        """
+        deadline = None                                 # wait forever
+        if timeout is not None :
+            deadline = time.time() + timeout            # wait until this time
+        with self.cond :
+            while True :
+                now = time.time()
+                if now - self.lastget > Feed.kidleinterval :    # if feeds stopped polling because nobody asked
+                    for feed in self.feeds :
+                        feed.wake()                     # start polling again
+                self.lastget = now                      # time of last get request, for idle check
+                item = self.popitem()                   # get best item
+                if item :                               # if got an item
+                    return(item)                        # return it
+                if self.wakeflag :                      # if woken up
+                    self.wakeflag = False
+                    return(None)
+                waitsecs = self.budgetwait              # None, or until held news fits print budget
+                if deadline is not None :
+                    waitsecs = min(waitsecs, deadline - now) if waitsecs is not None else deadline - now
+                    if waitsecs <= 0.0 :                # timed out
+                        return(None)                    # no new items available
+                self.waiters += 1                       # feeds keep polling while we wait
+                try :
+                    self.cond.wait(waitsecs)            # wait for a feed to queue something
+                finally :
+                    self.waiters -= 1
+                    self.lastget = time.time()          # waited until now
+
+    def iswanted(self, now) :                           # true if someone is asking for items
+        """
+        True if a "getitem" is waiting, or one was made in the last idle
+        interval.  Feeds stop polling when not.
+        """
+        with self.cond :
+            return(self.waiters > 0 or now - self.lastget <= Feed.kidleinterval)
+
+    def readycount(self, feed) :                        # feed's items which getitem could return now
+        """
+        Number of the feed's queued items not held back by the print budget.
+        """
+        with self.cond :
+            if self.budgetwait is None :                # budget not holding news
+                return(feed.queued)
+            return(feed.queued - feed.queuedheld)
+
+    def popitem(self) :                                 # get best item, must hold lock
+        self.budgetwait = None
+        now = time.time()
+        while self.queue :                              # until a current item found
+            (priority, tag, negtimestamp, seq, generation, feed, item) = self.queue[0]
+            if generation != feed.generation :          # if feed discarded it
+                heapq.heappop(self.queue)
+                continue                                # skip
+            if self.budget and priority == PRIORITYNEWS :   # if news subject to print budget
+                if self.budget.stale(item, now) :       # if never worth printing
+                    heapq.heappop(self.queue)
+                    self.dropstale(feed, item, priority)
+                    continue
+                waitsecs = self.budget.waitsecs(item, now)
+                if waitsecs > 0.0 :                     # if budget used up
+                    self.budgetwait = waitsecs          # hold news until it fits
+                    return(None)
+                self.budget.charge(now, item.printsecs) # charge print time
+            heapq.heappop(self.queue)
+            self.unqueued(feed, item, priority)
+            self.vtime = max(self.vtime, tag)           # fair queuing virtual time advances
+            if isinstance(item, Exception) :            # if item is an exception, thread raised an exception
+                raise item                              # raise exception to force shutdown
+            feed.outstanding.add(item)                  # item currently being worked on 
+            return(item)
+        return(None)
+
+    def purgestale(self, now) :                         # drop stale news anywhere in queue, must hold lock
+        if now - self.lastpurge < self.kpurgesecs :     # not too often, this looks at every item
+            return
+        self.lastpurge = now
+        kept = []
+        for entry in self.queue :
+            (priority, tag, negtimestamp, seq, generation, feed, item) = entry
+            if generation != feed.generation :          # feed discarded it
+                continue
+            if priority == PRIORITYNEWS and self.budget.stale(item, now) :
+                self.dropstale(feed, item, priority)
+                continue
+            kept.append(entry)
+        if len(kept) < len(self.queue) :                # if anything dropped
+            heapq.heapify(kept)
+            self.queue = kept
+
+    def dropstale(self, feed, item, priority) :         # item never worth printing, must hold lock
+        self.unqueued(feed, item, priority)
+        self.logger.info("Dropped, too old or too long for print budget: %s" % 
+            (item.summarytext()[:60],))
+
+    def unqueued(self, feed, item, priority) :          # item removed from queue, must hold lock
+        feed.queued -= 1
+        if self.budget and priority == PRIORITYNEWS :   # was counted as held
+            feed.queuedheld -= 1
+        feed.queuedchars -= item.printchars
+        self.queuedchars -= item.printchars
+
+    def queueitem(self, feed, item) :                   # called by a feed to queue an item
+        printchars = 0                                  # length for backlog estimate
+        if not isinstance(item, Exception) :
+            printchars = len(item.formattext())
+        item.printchars = printchars
+        with self.cond :
+            priority = feed.getpriority(item)
+            if self.budget and priority == PRIORITYNEWS :   # if news subject to print budget
+                self.purgestale(time.time())            # don't let expired news pile up behind held items
+                item.printsecs = self.budget.cost(item) # estimated print time
+                tag = self.budget.rank(feed.weight, item)   # order by value per second printed
+                feed.queuedheld += 1
+            else :
+                tag = max(feed.lasttag, self.vtime) + 1.0 / feed.weight  # fair queuing finish tag
+                feed.lasttag = tag
+            self.seq += 1
+            heapq.heappush(self.queue, (priority, tag, -getattr(item, "timestamp", 0.0),
+                self.seq, feed.generation, feed, item))
+            feed.queued += 1
+            feed.queuedchars += printchars
+            self.queuedchars += printchars
+            self.cond.notify_all()                      # wake "getitem"
+
+    def drainqueue(self, feed) :                        # discard a feed's queued items
+        with self.cond :
+            feed.generation += 1                        # entries of old generations are skipped
+            self.queuedchars -= feed.queuedchars
+            feed.queued = 0
+            feed.queuedheld = 0
+            feed.queuedchars = 0
+            feed.lasttag = 0.0
+
+    def backlogsecs(self, charsecs) :                   # estimated time to print everything queued
+        with self.cond :
+            return(self.queuedchars * charsecs)
+
+    def wakeup(self) :                                  # make a waiting "getitem" return now
+        with self.cond :
+            self.wakeflag = True
+            self.cond.notify_all()
 
     def setlasttitleprinted(self,title) :
         self.lasttitle = title                          # set last title printed
@@ -0,0 +1,115 @@
+#
+#    feedscheduler.py  -  poll many feeds from one event loop
+#
+#    Part of "baudottty".
+#
+#    Normally each feed is its own thread, which sleeps between polls.
+#    That's fine for a few feeds, but not for hundreds.  The FeedScheduler
+#    drives the polling of all feeds from one asyncio event loop instead.
+#    Fetching still blocks (feedparser, urllib), so fetches run in a small
+#    thread pool, limited in total and per host.
+#
+#    The feeds themselves, and the Feeds queue the user interface reads,
+#    work the same either way.
+#
+#    License: LGPL
+#
+import asyncio
+import concurrent.futures
+import threading
+#
+#   Constants
+#
+KMAXFETCHES = 8                                         # fetches in progress at once, all hosts
+KMAXPERHOST = 2                                         # fetches in progress at once, one host
+KABORTSECS = 20.0                                       # wait this long for fetches to finish on abort
+#
+#    class FeedScheduler  --  polls all feeds from one thread
+#
+class FeedScheduler(object) :
+    def __init__(self, logger, maxfetches=KMAXFETCHES, maxperhost=KMAXPERHOST) :
+        self.logger = logger
+        self.maxfetches = maxfetches                    # limit on fetches in progress
+        self.maxperhost = maxperhost                    # limit per host
+        self.loop = asyncio.new_event_loop()            # runs in our own thread
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=maxfetches)  # blocking fetches
+        self.fetchlimit = None                          # semaphore for all fetches, made in loop thread
+        self.hostlimits = {}                            # host -> semaphore
+        self.tasks = {}                                 # feed -> asyncio task polling it
+        self.started = threading.Event()                # set when loop is running
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True                       # don't keep program alive
+        self.thread.start()
+        self.started.wait()
+
+    #    Called from outside the thread
+
+    def addfeed(self, feed) :                           # start polling a feed
+        self.loop.call_soon_threadsafe(self.startfeed, feed)
+
+    def abort(self) :                                   # stop polling all feeds, wait for fetches
+        future = asyncio.run_coroutine_threadsafe(self.finish(), self.loop)
+        try :
+            future.result(KABORTSECS)                   # wait for feed tasks to end
+        except concurrent.futures.TimeoutError :
+            raise RuntimeError('INTERNAL ERROR: feed scheduler will not terminate.  Kill program.')
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.executor.shutdown(wait=False)
+        self.logger.debug("Feed scheduler shut down.")
+
+    #    Called from within the thread
+
+    def run(self) :                                     # event loop thread
+        asyncio.set_event_loop(self.loop)
+        self.fetchlimit = asyncio.Semaphore(self.maxfetches)
+        self.loop.call_soon(self.started.set)           # running now
+        try :
+            self.loop.run_forever()
+        finally :
+            self.loop.close()
+
+    def startfeed(self, feed) :                         # start task polling one feed
+        wakeup = asyncio.Event()                        # set to end wait between polls
+        feed.onwake = lambda : self.loop.call_soon_threadsafe(wakeup.set)
+        self.tasks[feed] = self.loop.create_task(self.runfeed(feed, wakeup))
+
+    async def finish(self) :                            # abort all feeds, wait for their tasks
+        for feed in self.tasks :
+            feed.aborting = True                        # abort at next wakeup
+            feed.wake()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+
+    #
+    #    runfeed  --  poll one feed until aborted
+    #
+    #    Like Feed.run, but waiting on the event loop instead of in a thread.
+    #
+    async def runfeed(self, feed, wakeup) :
+        try :
+            while not feed.aborting :                   # until killed
+                wakeup.clear()                          # wakeups from here on end the wait
+                delay = await self.dopoll(feed)         # do a poll cycle
+                if feed.aborting :
+                    break
+                try :
+                    await asyncio.wait_for(wakeup.wait(), delay)    # wait for next poll or wakeup
+                except asyncio.TimeoutError :
+                    pass
+            self.logger.debug('Feed "%s" shutting down.' % (feed.gettitle(),))    # note abort
+        except Exception as message :                   # if trouble
+            self.logger.exception('Feed "%s" exception: %s' % (feed.gettitle(), str(message)))
+            feed.queueitem(message)                     # queue exception for main task and exit
+
+    async def dopoll(self, feed) :                      # one poll cycle, returns delay as Feed.dopoll
+        delay = feed.polldelay()                        # is a poll due?
+        if delay is None or delay > 0.0 :               # if not yet
+            return(delay)
+        host = feed.gethost()                           # limit fetches from this host
+        if host not in self.hostlimits :
+            self.hostlimits[host] = asyncio.Semaphore(self.maxperhost if host else self.maxfetches)
+        async with self.hostlimits[host] :              # limit fetches from one host
+            async with self.fetchlimit :                # limit all fetches
+                if feed.aborting :                      # aborted while waiting for a turn
+                    return(None)
+                return(await self.loop.run_in_executor(self.executor, feed.pollnow))
@@ -0,0 +1,196 @@
+#
+#    feedstate.py  -  news feed state kept on disk across restarts
+#
+#    Part of "baudottty".
+#
+#    Remembers which news items have been seen, per feed URL, in an SQLite
+#    database shared by all news feeds.  Without this, every start has to
+#    mark everything in every feed as read, and skip a full poll cycle,
+#    to avoid reprinting old news.  With it, only feeds never polled before
+#    need that.
+#
+#    It also keeps each feed's title and its conditional GET validators
+#    (ETag and Last-Modified), so the first poll after a restart of a feed
+#    which hasn't changed gets a short "304 Not Modified" reply, and a
+#    digest of the last feed document, for servers which never send one.
+#
+#    Writes are collected and committed once per poll, not per item.
+#
+#    License: LGPL
+#
+import sqlite3
+import threading
+import time
+import collections
+#
+#    class FeedState  --  the on-disk store
+#
+class FeedState(object) :
+    kfeedcolumns = ["etag", "modified", "title", "bodydigest"]  # per feed, saved after each poll
+    def __init__(self, path, logger) :
+        self.logger = logger
+        self.lock = threading.Lock()                    # one feed at a time; feeds poll from many threads
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS seen "
+            "(url TEXT, digest TEXT, lastseen REAL, PRIMARY KEY (url, digest))")
+        self.db.execute("CREATE INDEX IF NOT EXISTS seenbytime ON seen (url, lastseen)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS feeds (url TEXT PRIMARY KEY, firstpoll REAL)")
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(feeds)")]
+        for column in self.kfeedcolumns :               # add columns missing from older databases
+            if column not in columns :
+                self.db.execute("ALTER TABLE feeds ADD COLUMN %s TEXT" % (column,))
+        self.db.commit()
+        self.pendingseen = {}                           # (url, digest) -> lastseen, not yet written
+        self.pendingforget = []                         # (url, digest or None for all, before) to delete
+        self.pendingfeeds = {}                          # url -> (etag, modified, title, bodydigest), not yet written
+        self.logger.info("Feed state in %s." % (path,))
+
+    def load(self, url) :                               # [(digest, lastseen)] for a feed, oldest first
+        with self.lock :
+            return(self.db.execute("SELECT digest, lastseen FROM seen WHERE url = ? ORDER BY lastseen",
+                (url,)).fetchall())
+
+    def known(self, url) :                              # true if feed has been polled before
+        with self.lock :
+            return(self.db.execute("SELECT 1 FROM feeds WHERE url = ?", (url,)).fetchone() is not None)
+
+    def getfeed(self, url) :                            # (etag, modified, title, bodydigest) from last run, or Nones
+        with self.lock :
+            row = self.db.execute("SELECT %s FROM feeds WHERE url = ?" % (", ".join(self.kfeedcolumns),),
+                (url,)).fetchone()
+        if row is None :
+            return((None,) * len(self.kfeedcolumns))
+        return(tuple(row))
+
+    def setfeed(self, url, etag, modified, title, bodydigest) : # save validators, title, body digest at next flush
+        with self.lock :
+            self.pendingfeeds[url] = (etag, modified, title, bodydigest)
+
+    def seen(self, url, digest, when) :                 # note item seen
+        with self.lock :
+            self.pendingseen[(url, digest)] = when
+
+    def forget(self, url, digest=None, before=None) :   # forget one item, all items, or all seen before a time
+        with self.lock :
+            for key in [key for key in self.pendingseen if key[0] == url and
+                    (digest is None or key[1] == digest) and
+                    (before is None or self.pendingseen[key] < before)] :
+                del(self.pendingseen[key])
+            self.pendingforget.append((url, digest, before))
+
+    def flush(self, url=None) :                         # write pending changes, note feed URL polled
+        with self.lock :
+            if self.db is None :                        # closed, shutting down
+                return
+            for (furl, digest, before) in self.pendingforget :
+                sql = "DELETE FROM seen WHERE url = ?"
+                args = [furl]
+                if digest is not None :
+                    sql += " AND digest = ?"
+                    args.append(digest)
+                if before is not None :
+                    sql += " AND lastseen < ?"
+                    args.append(before)
+                self.db.execute(sql, args)
+            self.db.executemany("INSERT OR REPLACE INTO seen (url, digest, lastseen) VALUES (?,?,?)",
+                [(furl, digest, when) for ((furl, digest), when) in self.pendingseen.items()])
+            if url is not None :
+                self.db.execute("INSERT OR IGNORE INTO feeds (url, firstpoll) VALUES (?,?)", (url, time.time()))
+            for (furl, values) in self.pendingfeeds.items() :
+                self.db.execute("INSERT OR IGNORE INTO feeds (url, firstpoll) VALUES (?,?)", (furl, time.time()))
+                self.db.execute("UPDATE feeds SET %s WHERE url = ?" %
+                    (", ".join("%s = ?" % (column,) for column in self.kfeedcolumns),),
+                    tuple(values) + (furl,))
+            self.db.commit()                            # one transaction for everything
+            self.pendingseen = {}
+            self.pendingforget = []
+            self.pendingfeeds = {}
+
+    def close(self) :                                   # write pending changes and close; may be called again
+        self.flush()
+        with self.lock :
+            if self.db is not None :
+                self.db.close()
+                self.db = None                          # later flushes do nothing
+
+#
+#    class SeenItems  --  digests of items seen for one feed, with time last seen
+#
+#    A dict, kept in memory, which also records changes in a FeedState if
+#    given one.  Only item assignment, deletion, "clear" and "expire" are
+#    recorded.
+#
+#    Kept in order of time last seen, oldest first, by moving each item to
+#    the end when seen, so expiring old items only looks at the ones expired,
+#    not the whole feed history.  This assumes times seen don't go backwards;
+#    if they do, an item may just expire late.
+#
+class SeenItems(collections.OrderedDict) :
+    def __init__(self, state, url) :
+        collections.OrderedDict.__init__(self)
+        self.state = state                              # FeedState, or None for memory only
+        self.url = url
+        if state :
+            for (digest, when) in state.load(url) :     # items seen in earlier runs, oldest first
+                collections.OrderedDict.__setitem__(self, digest, when)
+
+    def __setitem__(self, digest, when) :
+        collections.OrderedDict.__setitem__(self, digest, when)
+        self.move_to_end(digest)                        # newest last
+        if self.state :
+            self.state.seen(self.url, digest, when)
+
+    def __delitem__(self, digest) :
+        collections.OrderedDict.__delitem__(self, digest)
+        if self.state :
+            self.state.forget(self.url, digest)
+
+    def clear(self) :
+        collections.OrderedDict.clear(self)
+        if self.state :
+            self.state.forget(self.url)
+
+    def expire(self, before) :                          # forget items not seen since "before"
+        expired = 0
+        while self :
+            digest = next(iter(self))                   # oldest
+            if self[digest] >= before :                 # rest are newer
+                break
+            collections.OrderedDict.__delitem__(self, digest)
+            expired += 1
+        if self.state and expired :
+            self.state.forget(self.url, before=before)
+        return(expired)
+
+    def flush(self) :                                   # write changes, note feed polled
+        if self.state :
+            self.state.flush(self.url)
+
+    def known(self) :                                   # true if feed was polled in an earlier run
+        return(self.state is not None and self.state.known(self.url))
+
+#
+#    Benchmark of expiry, against the old scan of every item seen.
+#
+def benchmark(items=50000, polls=200, peritem=1.0) :
+    """
+    Each simulated poll sees one new item, and expires items older than "items" polls.
+    """
+    def scan(seen, before) :                            # old way, look at everything
+        expired = [digest for digest in seen if seen[digest] < before]
+        for digest in expired :
+            del(seen[digest])
+        return(len(expired))
+    for (name, seen, expire) in [("scan, dict", {}, scan),
+            ("ordered, SeenItems", SeenItems(None, "benchmark"), SeenItems.expire)] :
+        for i in range(items) :                         # steady state history
+            seen["%032x" % (i,)] = i * peritem
+        start = time.perf_counter()
+        for i in range(items, items + polls) :          # one new item, one expired, per poll
+            seen["%032x" % (i,)] = i * peritem
+            expire(seen, (i - items + 1) * peritem)
+        elapsed = time.perf_counter() - start
+        print("%-20s %6d items: %8.1f us per expiry" % (name, len(seen), elapsed / polls * 1.0e6))
+
+if __name__ == "__main__" :                             # if run as a benchmark
+    benchmark()
@@ -4,6 +4,9 @@
 #   Part of baudotrss
 #
 import re
+import html
+import html.parser
+import html.entities
 #
 #   Utility functions
 #
@@ -31,3 +34,288 @@ def editdate(dt) :
     day = re.sub(r'^0+','',day)                 # "2"
     s = "%s %s%s" % (month, day, suffix)        # "March 2nd"
     return(s)
+#
+#   HTML to plain text, for printing news items.
+#
+#   Markup is dropped, paragraphs and line breaks become blank lines, entities
+#   become the characters they stand for, and runs of white space become one
+#   space.  Link text is kept, the link is not.  Scripts, styles, and feed
+#   sharing gadgets are dropped entirely.
+#
+kreparagraph = re.compile(r'\n\s*\n\s*')                # a blank line in text
+KSPACE = r'[ \t\n\r\f]'                                 # white space in tags, as html.parser has it
+KATTRS = (r'(?:%s+[^\s"\'<>/=]+(?:%s*=%s*(?:"[^"<>]*"|\'[^\'<>]*\'|[^\s"\'=<>`]+))?)*' %
+    (KSPACE, KSPACE, KSPACE))                           # well-formed attributes
+kretag = re.compile(r'<(/?)([a-zA-Z][a-zA-Z0-9]*)(%s)%s*(/?)>' % (KATTRS, KSPACE))  # a plain tag
+kreattr = re.compile(r'([^\s"\'<>/=]+)(?:%s*=%s*(?:"([^"<>]*)"|\'([^\'<>]*)\'|([^\s"\'=<>`]+)))?' %
+    (KSPACE, KSPACE))                                   # one attribute
+kreskiptag = re.compile(r'<[sSoOiInN]')                 # might be a tag whose contents are dropped
+kreclassentity = re.compile(r'class%s*=[^>]*&' % (KSPACE,))   # in lower case, class might be escaped
+kremarks = re.compile('(\x02[\x01\x02 ]*)')             # breaks, and white space after them
+kreentity = re.compile(r'(&[#a-zA-Z0-9]+;)')            # an entity, ending with ";"
+kentities = dict(("&" + name, ch) for (name, ch) in html.entities.html5.items() if name.endswith(";"))
+KMAXENTITIES = 5000                                     # numeric entities are added to kentities up to this
+#
+class HTMLTextExtractor(html.parser.HTMLParser) :
+    kbreaktags = {"p" : 2, "br" : 2, "div" : 2, "blockquote" : 2, "hr" : 2,
+        "h1" : 2, "h2" : 2, "h3" : 2, "h4" : 2, "h5" : 2, "h6" : 2,
+        "table" : 2, "tr" : 2, "ul" : 2, "ol" : 2, "li" : 1}  # newlines for a break at this tag
+    kskiptags = set(["script", "style", "object", "iframe", "noscript"])  # contents dropped
+    kskipclasses = set(["feedflare"])                   # contents of elements of this class dropped
+
+    def __init__(self) :
+        html.parser.HTMLParser.__init__(self, convert_charrefs=True)
+        self.pieces = []                                # output text
+        self.separator = ""                             # white space pending before next text
+        self.skipping = None                            # tag whose contents are being dropped
+        self.skipdepth = 0                              # nesting depth of that tag
+
+    def gettext(self) :                                 # all text so far
+        return("".join(self.pieces))
+
+    def space(self, sep) :                              # white space, the most newlines wins
+        if not self.separator or sep.count("\n") > self.separator.count("\n") :
+            self.separator = sep
+
+    def addtext(self, data) :                           # text, without paragraph breaks
+        words = data.split()
+        if not words :                                  # white space only
+            if data :
+                self.space(" ")
+            return
+        if data[0].isspace() :
+            self.space(" ")
+        if self.pieces :                                # no white space at beginning
+            self.pieces.append(self.separator)
+        self.pieces.append(" ".join(words))
+        self.separator = ""
+        if data[-1].isspace() :
+            self.space(" ")
+
+    def handle_data(self, data) :
+        if self.skipping :
+            return
+        paragraphs = kreparagraph.split(data)           # blank lines in text are paragraph breaks
+        self.addtext(paragraphs[0])
+        for paragraph in paragraphs[1:] :
+            self.space("\n\n")
+            self.addtext(paragraph)
+
+    def handle_starttag(self, tag, attrs) :
+        if self.skipping :
+            if tag == self.skipping :                   # nested, must see one more end tag
+                self.skipdepth += 1
+            return
+        classes = (dict(attrs).get("class") or "").split()
+        if tag in self.kskiptags or self.kskipclasses.intersection(classes) :
+            self.skipping = tag                         # drop contents until matching end tag
+            self.skipdepth = 1
+            return
+        if tag in self.kbreaktags :
+            self.space("\n" * self.kbreaktags[tag])
+
+    def handle_endtag(self, tag) :
+        if self.skipping :
+            if tag == self.skipping :
+                self.skipdepth -= 1
+                if self.skipdepth == 0 :                # end of dropped contents
+                    self.skipping = None
+            return
+        if tag in self.kbreaktags and tag != "br" :     # end of block
+            self.space("\n" * self.kbreaktags[tag])
+
+#
+#   Converting markup without the parser
+#
+#   Most feeds use only plain tags and entities.  For those, tags become
+#   markers in the text: \x02 for a break of two newlines, \x02\x01 for one,
+#   and \x03 for other tags, which keep text pieces apart without white space.
+#   Then a few passes over the whole text do what HTMLTextExtractor does piece
+#   by piece.  Anything else, such as comments, or elements whose contents are
+#   dropped or are not markup, goes to the parser.
+#
+def tagsnamed(name, endname) :                          # plain start and end tags, names as patterns
+    return(re.compile(r'<(?:%s%s%s*/?|/%s%s*)>' % (name, KATTRS, KSPACE, endname, KSPACE)))
+
+def breaktags(breaks) :                                 # tags which break with "breaks" newlines, any case
+    def anycase(name) :
+        return("".join("[%s%s]" % (c.lower(), c.upper()) if c.isalpha() else c for c in name))
+    names = [anycase(tag) for (tag, n) in HTMLTextExtractor.kbreaktags.items() if n == breaks]
+    endnames = [anycase(tag) for (tag, n) in HTMLTextExtractor.kbreaktags.items() if n == breaks and tag != "br"]
+    return(tagsnamed("(?:%s)" % ("|".join(names),), "(?:%s)" % ("|".join(endnames) or "(?!)",)))
+
+kretwobreaks = breaktags(2)
+kreonebreak = breaktags(1)
+kreanytag = tagsnamed(r'[a-zA-Z][a-zA-Z0-9]*', r'[a-zA-Z][a-zA-Z0-9]*')
+kmarks = dict([(tag, "\x02\x01" if breaks == 1 else "\x02") for (tag, breaks) in HTMLTextExtractor.kbreaktags.items()] +
+    [("/" + tag, "\x02\x01" if breaks == 1 else "\x02") for (tag, breaks) in HTMLTextExtractor.kbreaktags.items()
+        if tag != "br"])                                # marks for break tags, start and end
+
+def plaintagstotext(s) :                                # htmltotext for plain tags, or None
+    if "\x01" in s or "\x02" in s or "\x03" in s :      # text has our markers in it
+        return(None)
+    for m in kreskiptag.finditer(s) :                   # script, style, etc.
+        tag = kretag.match(s, m.start())
+        if tag and tag.group(2).lower() in HTMLTextExtractor.kskiptags :
+            return(None)
+    if (any(name in s for name in HTMLTextExtractor.kskipclasses) or
+            ("&" in s and kreclassentity.search(s.lower()))) :
+        text = markskipping(s)                          # elements to drop, must look at each tag
+        if text is None :
+            return(None)
+    else :
+        text = kreanytag.sub("\x03", kreonebreak.sub("\x02\x01", kretwobreaks.sub("\x02", s)))
+        if "<" in text :                                # some "<" is not a plain tag
+            return(None)
+    text = unescape(text)                               # entities can't span markers
+    text = kreparagraph.sub("\x02", text)               # blank lines in text are paragraph breaks
+    text = " ".join(text.replace("\x03", "").split())   # white space runs are one space
+    pieces = kremarks.split(text.replace(" \x02", "\x02"))   # text, breaks, text...
+    pieces[1::2] = ["\n" if marks.count("\x02") == marks.count("\x01") else "\n\n"
+        for marks in pieces[1::2]]                      # the most newlines wins
+    return("".join(pieces).strip("\n"))
+
+def markskipping(s) :                                   # markers for tags, dropping skipped elements
+    pieces = kretag.split(s)                            # text, then 4 fields and text per tag
+    if len(pieces) // 5 != s.count("<") :               # some "<" is not a plain tag
+        return(None)
+    out = [pieces[0]]
+    skipping = None                                     # tag whose contents are being dropped
+    skipdepth = 0
+    for (slash, tag, attrtext, selfclosing, text) in zip(pieces[1::5], pieces[2::5], pieces[3::5],
+            pieces[4::5], pieces[5::5]) :
+        tag = tag.lower()
+        if slash and (attrtext or selfclosing) :        # parser may not see an end tag
+            return(None)
+        if skipping :
+            if tag == skipping :                        # nesting, as in HTMLTextExtractor
+                if slash :
+                    skipdepth -= 1
+                elif not selfclosing :
+                    skipdepth += 1
+                if skipdepth == 0 :                     # end of dropped contents
+                    skipping = None
+                    out.append("\x03")
+                    out.append(text)
+            continue
+        if not slash and attrtext and skipclass(attrtext) :
+            if not selfclosing :                        # drop contents until matching end tag
+                skipping = tag
+                skipdepth = 1
+                continue
+            out.append("\x03")
+        else :                                          # start tag, and end tag if self-closing
+            out.append(kmarks.get(slash + tag, "\x03"))
+        out.append(text)
+    return("".join(out))
+
+def unescape(s) :                                       # html.unescape, faster when all end with ";"
+    pieces = kreentity.split(s)                         # text, entity, text...
+    if len(pieces) // 2 != s.count("&") :               # not all, the meaning of some depends on what follows
+        return(html.unescape(s))
+    pieces[1::2] = [kentities.get(entity) or entityof(entity) for entity in pieces[1::2]]
+    return("".join(pieces))
+
+def entityof(entity) :                                  # one entity, usually numeric, remembered
+    ch = html.unescape(entity)
+    if len(kentities) < KMAXENTITIES :
+        kentities[entity] = ch
+    return(ch)
+
+def skipclass(attrtext) :                               # true if attributes give a class to drop
+    value = None
+    for m in kreattr.finditer(attrtext) :               # last class attribute counts, as in a dict
+        if m.group(1).lower() == "class" :
+            value = next((v for v in m.group(2, 3, 4) if v is not None), None)
+    classes = html.unescape(value or "").split()
+    return(bool(HTMLTextExtractor.kskipclasses.intersection(classes)))
+
+def htmltotext(s) :
+    """
+    Convert HTML to plain text for printing.
+    """
+    if "<" not in s and "&" not in s :                  # plain text, same result without the parser
+        return("\n\n".join(" ".join(paragraph.split()) 
+            for paragraph in kreparagraph.split(s) if paragraph.strip()))
+    text = plaintagstotext(s)                           # most feeds use only plain tags
+    if text is not None :
+        return(text)
+    extractor = HTMLTextExtractor()
+    extractor.feed(s)
+    extractor.close()
+    return(extractor.gettext())
+
+#
+#   Benchmark of htmltotext against the regular expression chain it replaced,
+#   and a check that plain text and plain tags get the same result as from
+#   the parser.
+#
+KTESTPIECES = ["<p>", "</p>", "<P>", "<p/>", "<p\n>", "<br>", "<br/>", "<BR />", "</br>", "<li>", "</li>",
+    "<b>", "</b>", "<i>", "<s>", "<o>", "<hr>", "<h1>", "</h1>", "<ul>", "<table>", "<tr>", "<pre>", "<x-y>",
+    '<a href="http://x/?a=1&amp;b=2">', "<a href=x>", "</a>", '<a href="x"class=y>', "<a =x>", "<a\x0bhref=x>",
+    '<div class="feedflare">', "<div class='feedflare x'>", "<div class=feedflare/>", "<DIV CLASS=FEEDFLARE>",
+    "<div class=feed&#102;lare>", "<a class=feedflare class=b>", "</div>", "<div>", "<img src=x/>",
+    "<span class=a>", "</span>", "</p class=x>", '<a b="c>d">', "<script>x<b>y</b></script>",
+    "<style>p{}</style>", "<noscript>", "<!-- c -->", "<", ">", "< b>",
+    "&amp;", "&amp", "&am", "p;", "&mdash;", "&#8212;", "&#x41;", "&quot;", "&lt;", "&", "&nosuch;",
+    "&#13;", "&#10;&#10;", "&#0;", "&#2;", "&notin;", "&not", "&#105;n;",
+    "a", "b ", " ", "\n", "\n\n", "\t", "\x0b", "\x1c", "\xa0", "\u2003", "\x03"]   # for the parser check
+
+def benchmark(count=2000) :
+    import time
+    import random
+    oldrewrites = [(re.compile(pattern), rep) for (pattern, rep) in [
+        (r'<div.*',''), (r'<a.*',''), (r'<p>','\n\n'), (r'</p>',' '), (r'<br>','\n\n'),
+        (r'<br/>','\n\n'), (r'<[^>]*>',' '), (r'&mdash;','-'), (r'&amp;','&'), (r'&\w+;','?'),
+        (r'&\#\w+;','?'), (r'<[^>]*>',' '), (r'[\t\r ]+',' '), (r'\n[ ]+','\n'), (r'\n\n\n+','\n\n')]]
+    def old(s) :
+        for (pattern, rep) in oldrewrites :
+            s = pattern.sub(rep, s)
+        return(s.strip())
+    def tokenizer(s) :
+        extractor = HTMLTextExtractor()
+        extractor.feed(s)
+        extractor.close()
+        return(extractor.gettext())
+    rand = random.Random(1)
+    mismatches = 0
+    for i in range(20000) :                             # plain text shortcut vs. parser
+        s = "".join(rand.choice("ab \t\n\r\x0b\x0c\xa0\u2003.") for j in range(rand.randint(0, 40)))
+        if htmltotext(s) != tokenizer(s) :
+            mismatches += 1
+    print("Plain text, 20000 random strings: %d differ from the parser." % (mismatches,))
+    mismatches = 0
+    plain = 0
+    for i in range(20000) :                             # plain tags without the parser vs. parser
+        s = "".join(rand.choice(KTESTPIECES) for j in range(rand.randint(0, 15)))
+        if plaintagstotext(s) is not None :
+            plain += 1
+        if htmltotext(s) != tokenizer(s) :
+            mismatches += 1
+    print("Markup, 20000 random strings, %d without the parser: %d differ from the parser." % (plain, mismatches))
+    paragraph = ("WASHINGTON (Reuters) - The U.S. Senate on Tuesday passed a bill &mdash; "
+        "the first in years &#8212; that &quot;would change everything,&quot; a senator said, "
+        "according to <a href=\"http://www.reuters.com/x\">a statement</a> from her office. ")
+    samples = [
+        ("Reuters, with trailer", "<p>" + paragraph * 3 + "</p>\n<p>" + paragraph * 2 + "</p>"
+            '<div class="feedflare"><a href="http://feeds.reuters.com/~ff/a"><img src="http://x/~ff/a"/></a></div>'
+            '<img src="http://feeds.feedburner.com/~r/x" height="1" width="1"/>'),
+        ("AP, paragraphs", "<p>" + "</p><p>".join([paragraph.replace("Reuters", "AP")] * 6) + "</p>"),
+        ("AP, no links", "<p>" + "</p><p>".join([paragraph.replace("Reuters", "AP")
+            .replace("<a href=\"http://www.reuters.com/x\">", "<b>").replace("</a>", "</b>")] * 6) + "</p>"),
+        ("plain text", "NEW YORK (AP) - Stocks rose on Tuesday, led by technology shares.  " * 8),
+        ]
+    for (name, s) in samples :
+        for (fnname, fn) in [("regex chain", old), ("htmltotext", htmltotext), ("html.parser", tokenizer)] :
+            elapsed = None
+            for trial in range(20) :                    # best of 20, machine may be busy
+                start = time.perf_counter()
+                for i in range(count // 20) :
+                    out = fn(s)
+                elapsed = min(elapsed or 1.0e9, time.perf_counter() - start)
+            print("%-22s %-12s %7.1f us  %4d chars out" % (name, fnname, elapsed / (count // 20) * 1.0e6, len(out)))
+        print("    old: %r" % (old(s)[:300],))
+        print("    new: %r" % (htmltotext(s)[:300],))
+
+if __name__ == "__main__" :                     # if run as a benchmark
+    benchmark()
@@ -22,9 +22,11 @@ sys.path.append("./feedparser")                         # in subdir
 import re
 import msgutils
 import feedparser
+import fastfeed
 import time
+from six.moves import urllib
 import feedmanager
-from six.moves import queue                             # Python 2/3 support
+import feedstate
 import email                                            # for date parsing
 import email.utils
 import calendar                                         # for date parsing
@@ -33,8 +35,15 @@ import hashlib
 #
 #    Constants
 #
-KPOLLINTERVAL = 90.0                                    # poll this often
+KPOLLINTERVAL = 90.0                                    # poll this often, to start
+KPOLLMIN = 60.0                                         # adaptive poll interval bounds
+KPOLLMAX = KPOLLINTERVAL                                # never less often than the old fixed interval
+KUSERAGENT = feedparser.USER_AGENT                      # identify ourselves as feedparser does
 NEWSMAXAGEDAYS = 30                                     # last 30 days of news only
+KPARAGRAPHMAX = 600                                     # longest first paragraph when shortened
+KHEADLINEMAX = 150                                      # longest headline made from body
+KSEENSTOP = 10                                          # stop reading feed after this many old entries in a row
+KFULLSCANSECS = 60*60*6                                 # but look at every entry this often
 #
 #    Support functions
 #
@@ -58,58 +67,83 @@ def textsubset(s1, s2) :
     """
     True if s1 is a subset of s2, considering alphanumeric chars only
     """
-    return(kremovenonalpha.sub("",s2).startswith(kremovenonalpha.sub("",s1)))
+    s1 = kremovenonalpha.sub("",s1)
+    n = len(s1) + 64                                    # only the beginning of s2 matters
+    while True :
+        start = kremovenonalpha.sub("",s2[:n])
+        if len(start) >= len(s1) or n >= len(s2) :      # enough to decide
+            return(start.startswith(s1))
+        n *= 2                                          # mostly punctuation, look further
     
 #
-#    class Newsfeed  --  one news feed
+kresentenceend = re.compile(r'[.!?]["\')]*\s')          # end of a sentence
 #
-class Newsfeed(feedmanager.Feed) :                            
+def firstparagraph(s) :
+    """
+    First paragraph of text
+    """
+    return(s.strip().split('\n\n')[0].strip())
 
-    #    FeedParser's list of acceptable HTML elements.
-    standard_acceptable_elements = ['a', 'abbr', 'acronym', 'address', 'area', 'b', 'big',
-      'blockquote', 'br', 'button', 'caption', 'center', 'cite', 'code', 'col',
-      'colgroup', 'dd', 'del', 'dfn', 'dir', 'div', 'dl', 'dt', 'em', 'fieldset',
-      'font', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'i', 'img', 'input',
-      'ins', 'kbd', 'label', 'legend', 'li', 'map', 'menu', 'ol', 'optgroup',
-      'option', 'p', 'pre', 'q', 's', 'samp', 'select', 'small', 'span', 'strike',
-      'strong', 'sub', 'sup', 'table', 'tbody', 'td', 'textarea', 'tfoot', 'th',
-      'thead', 'tr', 'tt', 'u', 'ul', 'var']
+def shorten(s, maxlen) :
+    """
+    Shorten text to at most about maxlen, at a sentence end if possible, else a word
+    """
+    if len(s) <= maxlen :                               # short enough
+        return(s)
+    ends = [m.end() for m in kresentenceend.finditer(s, 0, maxlen)]
+    if ends :                                           # cut after last whole sentence
+        return(s[:ends[-1]].rstrip())
+    ix = s.rfind(' ', 0, maxlen)                        # cut at word
+    if ix < maxlen // 2 :                               # no good word break
+        ix = maxlen
+    return(s[:ix].rstrip() + '...')
 
-    #    Our list. We drop almost all markup, then truncate at the first remaining tag.
-    acceptable_elements = ['a','p','br']            # severely censor HTML markup
-    #
-    kescaperemovals = [
-        (re.compile(r'&mdash;'),'-'),               # convert HTML escape for mdash
-        (re.compile(r'&amp;'),'&'),                 # convert HTML escape for ampersand
-        (re.compile(r'&\w+;'),'?'),                 # any other special chars become question mark
-        (re.compile(r'&\#\w+;'),'?'),               # get numeric escapes, too.
-        (re.compile(r'<[^>]*>'),' '),               # remove any remaining markup
-        (re.compile(r'[\t\r ]+'),' '),              # all whitespace becomes a single space
-        (re.compile(r'\n[ ]+'),'\n'),               # remove whitespace at end of line
-        (re.compile(r'\n\n\n+'),'\n\n')]            # never more than two newlines
+kremaxage = re.compile(r'max-age\s*=\s*(\d+)', re.IGNORECASE)
+#
+def cachehintsecs(d, now) :
+    """
+    Seconds the server asks us to wait before polling again, from HTTP
+    headers and the RSS "ttl", or 0.
+    """
+    headers = dict((k.lower(), v) for (k, v) in getattr(d, "headers", {}).items())
+    hints = [0.0]
+    m = kremaxage.search(headers.get("cache-control", ""))
+    if m :                                              # Cache-Control: max-age=N
+        hints.append(float(m.group(1)))
+    elif "expires" in headers :                         # Expires: date, if no max-age
+        expires = email.utils.parsedate_tz(headers["expires"])
+        if expires :
+            hints.append(email.utils.mktime_tz(expires) - now)
+    retryafter = headers.get("retry-after", "").strip() # Retry-After: seconds or date
+    if retryafter.isdigit() :
+        hints.append(float(retryafter))
+    elif retryafter :
+        retrydate = email.utils.parsedate_tz(retryafter)
+        if retrydate :
+            hints.append(email.utils.mktime_tz(retrydate) - now)
+    try :
+        ttl = getattr(d, "feed", {}).get("ttl")         # RSS ttl, minutes
+        if ttl :
+            hints.append(float(ttl) * 60.0)
+    except ValueError :                                 # ignore junk
+        pass
+    return(max(hints))
     
-    khtmrewrites = [                                # rewrite rules for cleaning up news items
-        (re.compile(r'<div.*'),''),                 # remove Reuters crap at end ***TEMP***
-        (re.compile(r'<a.*'),''),                   # remove Reuters crap at end ***TEMP***
-        (re.compile(r'<p>'),'\n\n'),                # convert breaks to newlines.
-        (re.compile(r'</p>'),' '),                  # remove closing paragraph tag
-        (re.compile(r'<br>'),'\n\n'),               # convert breaks to newlines.
-        (re.compile(r'<br/>'),'\n\n'),              # convert breaks to newlines.
-        (re.compile(r'<[^>]*>'),' ')]               # remove any remaining markup
-         
-    kdescriptionrewrites = khtmrewrites + kescaperemovals
+#
+#    class Newsfeed  --  one news feed
+#
+class Newsfeed(feedmanager.Feed) :                            
 
     #
     #    Called from outside the thread
     #
-    def __init__(self, url, logger) :
+    def __init__(self, url, logger, state=None) :
         feedmanager.Feed.__init__(self, "NEWS", logger)
+        self.state = state                              # FeedState remembering items seen, if any
+        self.pollinterval = feedmanager.PollInterval(KPOLLINTERVAL, KPOLLMIN, KPOLLMAX)
         self.setfeedurl(url)                            # set feed URL
         self.expirationsecs = 60*60*24*2                # expire after not seen for 2 days
         self.maxage = 60*60*24*NEWSMAXAGEDAYS           # don't show items older than this
-        ####print(feedparser._HTMLSanitizer.acceptable_elements)    # ***TEMP***
-        feedparser._HTMLSanitizer.acceptable_elements = self.acceptable_elements
-        ####print(feedparser._HTMLSanitizer.acceptable_elements)    # ***TEMP***
         ####self.expirationsecs = 60                        # ***TEMP DEBUG***
 
     def setfeedurl(self, url) :                            # set new feed URL
@@ -118,29 +152,27 @@ class Newsfeed(feedmanager.Feed) :
         ####self.hdrdate = None                                # no header date yet
         self.etag = None                                # no feed sequence id yet
         self.modified = None                            # no last-modified timestamp yet
-        self.itemqueued = {}                            # item has been queued for printing
-        self.markingallasread = True                    # marking all stories as read.
+        self.lastfullscan = 0.0                         # every entry looked at on first poll
+        self.bodydigest = None                          # digest of last feed document processed
+        self.parsesavoided = 0                          # polls with same document, not parsed again
+        self.itemqueued = feedstate.SeenItems(self.state, url)   # item has been queued for printing
+        self.markingallasread = not self.itemqueued.known()  # marking all stories as read, unless seen before
+        if self.state :                                 # resume where the last run left off
+            (self.etag, self.modified, self.hdrtitle, self.bodydigest) = self.state.getfeed(url)
 
     def markallasread(self) :                           # mark all stories as read
-        try: 
-            while True :                                # drain
-                self.inqueue.get_nowait()               # get input, if any
-        except queue.Empty:                             # when empty
-            pass                                        # done
+        self.drainqueue()                               # discard anything queued
         self.logger.info("News feed queue emptied.")
         self.markingallasread = True                    # mark all as read for one cycle            
 
     def unmarkallasread(self) :                         # clear items already read
-        try: 
-            while True :                                # drain
-                self.inqueue.get_nowait()               # get input, if any
-        except queue.Empty:                             # when empty
-            pass                                        # done
+        self.drainqueue()                               # discard anything queued
         self.logger.info("News feed queue restarted.")  # restarting from beginning
         self.markingallasread = False                   # do not mark all as read
-        self.itemqueued = {}                            # no item has been queued for printing
+        self.itemqueued.clear()                         # no item has been queued for printing
         self.modified = None                            # no last-modified date
         self.etag = None                                # no previous RSS read
+        self.bodydigest = None                          # process document even if unchanged
         self.forcepoll()                                # force an immediate poll
 
     def gettitle(self) :                                # get feed title 
@@ -150,20 +182,32 @@ class Newsfeed(feedmanager.Feed) :
             return(self.url)                            # use URL if unable to read
 
     def getpollinterval(self) :                            # how often to poll
-        return(KPOLLINTERVAL)
+        return(self.pollinterval.getinterval())
+
+    def setpollbounds(self, minsecs, maxsecs) :         # limits on adaptive poll interval
+        self.pollinterval.setbounds(minsecs, maxsecs)
+
+    def gethost(self) :                                 # host polled, for per-host limits
+        return(urllib.parse.urlsplit(self.url).hostname)
 
     def itemdone(self, item) :                            # done with this item - item printed
         pass                                            # we don't keep persistent state of news printed
 
-    def formattext(self, msgitem) :                        # format a msg item, long form
+    def formattext(self, msgitem, level=feedmanager.FORMATFULL) :  # format a msg item, long form
         emsg = msgitem.errmsg
         date_string = "%s, %s" % (msgitem.msgdate, msgitem.msgtime)    # formatted time
         #    Format for printing as display message
         if emsg :                                        # short format for errors
             s = "%s: %s\n" % (date_string, emsg)
             return(s)                                    # return with error msg
+        if level >= feedmanager.FORMATHEADLINE :         # headline only
+            headline = msgitem.subject or shorten(firstparagraph(msgitem.body), KHEADLINEMAX)
+            return(headline + ' (' + date_string + ')\n\n')
+        body = msgitem.body
+        if level == feedmanager.FORMATPARAGRAPH :        # first paragraph only
+            body = shorten(firstparagraph(body), KPARAGRAPHMAX)
         #    Long form display
-        s = msgitem.subject + '\n(' + date_string + ')\n' + msgitem.body + '\n\n' # Add CR at end
+        s = msgitem.subject + '\n(' + date_string + ')\n' + body + '\n\n' # Add CR at end
         return(s)                                        # no error
 
     def summarytext(self, msgitem) :
@@ -184,15 +228,20 @@ class Newsfeed(feedmanager.Feed) :
         """
         Fetch more items from feed source.
         """
+        hintsecs = 0.0                                  # server's wishes about next poll
         try :                                           # try fetching
             now = time.time()                           # timestamp
-            d = feedparser.parse(self.url,etag=self.etag,modified=self.modified)    # fetch from URL
+            fullscan = self.markingallasread or now - self.lastfullscan >= KFULLSCANSECS
+            d = self.fetchfeed(now, fullscan)           # fetch from URL
             if d is None or not hasattr(d,"status") :   # if network failure
                 raise IOError("of network or news source failure")
+            hintsecs = cachehintsecs(d, now)            # Cache-Control, Retry-After, etc.
             if d.status == 304 :                        # if no new items
-                self.logger.debug("Feed polled, no changes.")
+                self.pollinterval.nochange(hintsecs)    # poll less often
+                self.logger.debug("Feed polled, no changes.  Next poll in %1.0fs." % (self.getpollinterval(),))
                 return                                  # nothing to do
-            self.logger.debug("Read feed: %d entries, status %s" % (len(d.entries), d.status))
+            self.logger.debug("Read feed: %d entries looked at, %d unseen, status %s" %
+                (d.scanned, len(d.entries), d.status))
             if d.status != 200 :                        # if bad status
                 raise IOError("of connection error No. %d" % (d.status,))
             #   Get fields from feed.  
@@ -206,44 +255,171 @@ class Newsfeed(feedmanager.Feed) :
             if hasattr(d,"etag") :                      # if feed has etag indicating sequence    
                 self.etag = d.etag                      # save position in feed for next time
             else :                                      # no etag, must re-read whole feed every time
-                etag = None
+                self.etag = None
             self.modified = getattr(d,"modified",None)  # save last update timestamp, if any, for next time
+            self.bodydigest = getattr(d,"bodydigest",None)  # save document digest, if any, for next time
             hdrdate = "" #### d.feed.date               # date as string
-            #    Process all entries in feed just read.
-            #    Ignore items that were previously seen
-            for entry in d.entries :                    # get items from feed
-                msgitem = self.doentry(entry, now)      # do this entry
-                if msgitem :                            # if new item to print
-                    self.inqueue.put(msgitem)           # save this item
+            #    Process entries in feed just read not seen before, as sent.
+            #    Ignore items that were previously seen after cleanup.
+            newitems = 0                                # new items this poll
+            if self.markingallasread :                  # if marking all as read, just note as seen
+                self.seedentries(d.entries, now)
+            else :
+                for (entry, rawkey, seen) in d.entries :    # get items from feed
+                    msgitem = self.doentry(entry, now, seen)    # do this entry
+                    self.itemqueued[rawkey] = now       # don't look at this entry again
+                    if msgitem :                        # if new item to print
+                        self.queueitem(msgitem)         # save this item
+                        newitems += 1
+            if fullscan :                               # all entries refreshed in itemqueued
+                self.lastfullscan = now
+            if newitems :                               # adjust poll interval to rate of new items
+                self.pollinterval.arrived(newitems, now, hintsecs)
+            elif self.markingallasread :                # everything counts as old, start timing from now
+                self.pollinterval.arrived(1, now, hintsecs)
+            else :
+                self.pollinterval.nochange(hintsecs)
+            self.logger.debug("%d new items.  Next poll in %1.0fs." % (newitems, self.getpollinterval()))
             self.markingallasread = False               # if marking all as read, stop doing that.
             #    Purge stories not seen in a while.
-            self.purgeolditems(now-self.expirationsecs, self.itemqueued)    # purge old previousy read stories when expired
+            #    We have to do this the hard way, because stories can appear in the feed, be preempted
+            #    by higher priority stories, and reappear later.
+            expired = self.itemqueued.expire(now-self.expirationsecs)  # purge old previously read stories
+            if expired :
+                self.logger.debug("Expired %d old items." % (expired,))
+            if self.state :                             # save validators and title for next run
+                self.state.setfeed(self.url, self.etag, self.modified, self.hdrtitle, self.bodydigest)
+            self.itemqueued.flush()                     # save items seen
 
         except (IOError, AttributeError) as message :   # if trouble
+            self.pollinterval.nochange(hintsecs)        # back off, honoring Retry-After
             self.logger.exception(message)              # debug
             errmsg = 'No "%s" news because %s.' % (self.gettitle(), str(message))
             self.logerror(errmsg)                       # log
 
-    def purgeolditems(self,expirationtime,dict) :       # purge old items already seen and printed
-        #    We have to do this the hard way, because stories can appear in the feed, be preempted
-        #    by higher priority stories, and reappear later.
-        expired = []                                    # expired items
-        for elt in dict :                               # for item in dictionary
-            if dict[elt] < expirationtime :             # if expired
-                expired.append(elt)                     # note expired
-        for elt in expired :                            # for all expired items
-            del(dict[elt])                              # delete from dict
-            self.logger.debug("Expired: %s" % (elt,))   # debug
+    def fetchfeed(self, now, fullscan) :
+        """
+        Fetch and parse the feed, returning a feedparser result or one like it,
+        but with only unseen entries, as (entry, raw key, seen) triples.
+        "scanned" is the number of entries looked at.
+
+        Simple RSS 2.0 and Atom documents are parsed by fastfeed, as far as
+        needed, anything else by feedparser.  Non-HTTP URLs are left entirely
+        to feedparser.  A document the same as last time is not parsed,
+        unless "fullscan", since the last scan may have stopped early.
+        """
+        if not self.url.lower().startswith(("http:", "https:")) :
+            d = feedparser.parse(self.url,etag=self.etag,modified=self.modified)
+            (d["entries"], d["scanned"]) = self.unseenentries(d.entries, now, fullscan)
+            return(d)
+        (status, headers, body) = fastfeed.fetch(self.url, self.etag, self.modified, KUSERAGENT)
+        d = None
+        if status == 200 and not fullscan and fastfeed.unchanged(body, self.bodydigest) :   # server ignored conditional GET
+            self.parsesavoided += 1
+            self.logger.debug("Feed document unchanged, not parsed.  %d parses avoided." % (self.parsesavoided,))
+            status = 304                                # same as not modified
+        if status == 200 :                              # if got a document
+            d = self.fastparse(body, now, fullscan)     # try the fast way
+            if d is None :                              # not simple, feedparser can cope
+                self.logger.debug("Feed is not simple RSS or Atom, using feedparser.")
+                d = feedparser.parse(body, response_headers=headers)
+                (d["entries"], d["scanned"]) = self.unseenentries(d.entries, now, fullscan)
+        if d is None :                                  # no document
+            d = fastfeed.ParsedDict(feed=fastfeed.ParsedDict(), entries=[], scanned=0)
+        d["status"] = status                            # fill in what feedparser would have from HTTP
+        d["headers"] = headers
+        if "etag" in headers :
+            d["etag"] = headers["etag"]
+        if "last-modified" in headers :
+            d["modified"] = headers["last-modified"]
+        if status == 200 :
+            d["bodydigest"] = fastfeed.bodydigest(body)
+        return(d)
+
+    def fastparse(self, body, now, fullscan) :          # parse with fastfeed, None if it can't
+        feed = fastfeed.ParsedDict()
+        try :
+            (entries, scanned) = self.unseenentries(fastfeed.iterentries(body, feed), now, fullscan)
+        except fastfeed.Rejected :
+            return(None)
+        if "title" not in feed :                        # may be after the entries not parsed
+            if not self.hdrtitle :
+                return(None)
+            feed["title"] = self.hdrtitle
+        feed.setdefault("description", "")
+        return(fastfeed.ParsedDict(feed=feed, entries=entries, scanned=scanned))
+
+    def unseenentries(self, entries, now, fullscan) :
+        """
+        Entries whose raw keys have not been seen, with those keys, and the
+        number of entries looked at.  With "fullscan", all entries, noting
+        which were seen.
+
+        Feeds list the newest entries first, so unless "fullscan", stop after
+        KSEENSTOP entries in a row which were seen before.  Given a generator,
+        the rest of the feed is never parsed.
+        """
+        unseen = []
+        scanned = 0
+        seeninarow = 0
+        for entry in entries :
+            scanned += 1
+            rawkey = self.rawkey(entry)
+            seen = rawkey in self.itemqueued
+            if seen and not fullscan :                  # same as last time, skip it
+                self.itemqueued[rawkey] = now           # still in feed
+                seeninarow += 1
+                if seeninarow >= KSEENSTOP :            # rest of feed is older
+                    break
+                continue
+            seeninarow = 0
+            unseen.append((entry, rawkey, seen))
+        return((unseen, scanned))
+
+    def rawkey(self, entry) :
+        """
+        Cheap identity of an entry as sent, before any cleanup.
+        ID or link, title, and description.
+        """
+        m = hashlib.md5()
+        m.update(repr(getattr(entry, "id", None) or getattr(entry, "link", None)).encode("utf8"))
+        m.update(repr(getattr(entry, "title", None)).encode("utf8"))
+        m.update(repr(getattr(entry, "description", None)).encode("utf8"))
+        return("r" + m.hexdigest())                     # marked to tell from item digests
+
+    def textkey(self, entry) :
+        """
+        Cheap identity of an entry's text as sent, ignoring its ID.
+        Source, title, and description, before any cleanup.
+        """
+        return("t" + self.digestof(self.gettitle(), getattr(entry, "title", None),
+            getattr(entry, "description", None)))      # marked to tell from item digests
+
+    def seedentries(self, entries, now) :
+        """
+        Mark entries as seen, without preparing them for printing.
+
+        The raw key catches entries sent again unchanged, and the text key
+        entries sent again under a new ID, as the item digest would, without
+        the cost of cleaning up the text.
+        """
+        for (entry, rawkey, seen) in entries :
+            self.itemqueued[rawkey] = now
+            self.itemqueued[self.textkey(entry)] = now
+        self.logger.debug("Marked %d feed items as read." % (len(entries),))
 
-    def doentry(self,entry, now)    :                       # do one feed entry
+    def cleanentry(self, entry) :                           # (title, description) of entry, as printed
         title = self.cleandescription(entry.title)          # title of entry
-        id = getattr(entry,"id", None)                      # ID of entry
-        description = entry.description                     # description of entry
         #    Clean up news item.  Should do this via feedparser utilities.
         description = self.cleandescription(entry.description)
         #   Check for title just being the beginning of the description
         if textsubset(title, description) :                 # if title is just beginning of description
             title = ""                                      # drop title
+        return((title, description))
+
+    def doentry(self,entry, now, seen=False) :              # do one feed entry, seen if raw key was
+        id = getattr(entry,"id", None)                      # ID of entry
+        (title, description) = self.cleanentry(entry)       # clean up title and description
         try :                                               # feedparser >= 5.1.1
             date = entry.published                          # publication date of entry
             dateparsed = entry.published_parsed             # date parsed
@@ -262,10 +438,15 @@ class Newsfeed(feedmanager.Feed) :
             msgutils.editdate(dateparsed), 
             msgutils.edittime(dateparsed), 
             title, description)
+        msgitem.timestamp = timestamp                       # publication time, for ordering
         #    Have we read this item already?  Check for duplicates.
         #    If either the ID or the text is duplicated, it's a duplicate.
         #    Sometimes IDs change when the text does not, because of server-side problems.
-        seen = msgitem.digest in self.itemqueued        # true if already seen
+        seen = seen or msgitem.digest in self.itemqueued    # true if already seen
+        textkey = self.textkey(entry)                   # recorded if marked as read
+        if textkey in self.itemqueued :                 # marked as read, maybe under another ID
+            seen = True
+            self.itemqueued[textkey] = now              # keep while still in feed
         if self.markingallasread :                      # if marking all as read
             seen = True                                 # pretend we've seen this story
         self.itemqueued[msgitem.digest] = now           # keep keys of stories read
@@ -286,12 +467,7 @@ class Newsfeed(feedmanager.Feed) :
     def cleandescription(self, s)    :                        # clean up description (item body) for printing
         if s is None :
             return(s)                                       # handle no description case
-        #    Clean up news item.  Should do this via feedparser utilities.
-        ####print("Before clean:\n" + s.encode('ascii','replace'))            # ***TEMP***
-        for (pattern, rep) in self.kdescriptionrewrites :    # apply all rewrite rules
-            s = pattern.sub(rep, s)                            # in sequence
-        ####print("After clean:\n" + s.encode('ascii','replace'))                # ***TEMP***
-        return(s.strip())                                    # remove any lead/trail white space 
+        return(msgutils.htmltotext(s))                      # markup to plain text, one pass
 
     def calcdigest(self, item) :                 
         """
@@ -299,11 +475,14 @@ class Newsfeed(feedmanager.Feed) :
         Version for news feeds only.  Only looks at source, title and body.
         Some news sources (esp. Reuters) will resend the same message with a new timestamp. 
         """
+        item.digest = self.digestof(item.msgfrom, item.subject, item.body)  # to check if seen before
+
+    def digestof(self, msgfrom, subject, body) :        # digest of item fields, as hex string
         m = hashlib.md5()                               # begin a hash of the fields present
-        m.update(repr(item.msgfrom).encode("utf8"))     # source
-        m.update(repr(item.subject).encode("utf8"))     # subject
-        m.update(repr(item.body).encode("utf8"))        # body of msg
-        item.digest = m.hexdigest()                     # get message digest as hex string, to check if seen before
+        m.update(repr(msgfrom).encode("utf8"))          # source
+        m.update(repr(subject).encode("utf8"))          # subject
+        m.update(repr(body).encode("utf8"))             # body of msg
+        return(m.hexdigest())
         
         
     
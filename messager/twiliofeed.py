@@ -137,13 +137,16 @@ class Twiliofeed(feedmanager.Feed) :
     def getpollinterval(self) :                            # poll this often
         return(self.kpollinterval)
 
+    def gethost(self) :                                 # host polled, for per-host limits
+        return(urllib.parse.urlsplit(self.serverpollurl).hostname)
+
     def markallasread(self) :
         pass                                  # deliberately not supported for messages
 
     def unmarkallasread(self) :               # deliberately not supported for messages
         pass
 
-    def formattext(self, msgitem) :                        # format a msg item, long form
+    def formattext(self, msgitem, level=feedmanager.FORMATFULL) :  # format a msg item, long form
         emsg = msgitem.errmsg
         #    Format for printing as display message
         if emsg :                                       # short format for errors
@@ -297,7 +300,7 @@ class Twiliofeed(feedmanager.Feed) :
             msgitem.setto(msgto)
         msgitem.serial = fields['serial']               # meg serial for completion
         self.logger.debug("New SMS message: %s" % (repr(fields),))
-        self.inqueue.put(msgitem)                       # output message item
+        self.queueitem(msgitem)                         # output message item
      
     def fetcherror(self, msgtxt, message) :             # report fetch error
         if message and len(str(message)) > 0:           # if useful exception info
@@ -22,6 +22,9 @@ import newsfeed
 import twiliofeed
 import twiliosend
 import feedmanager
+import feedscheduler
+import feedstate
+import os
 import time
 import re
 from six.moves import queue                 # Python 2/3 support
@@ -56,8 +59,7 @@ def printweather(ui) :
     (state, city, zip) = ui.weathercity     # get city and state
     s = nwsweatherreport.getweatherreport(city, state, zip)
     s = ui.tty.convertnonbaudot(s)          # convert special chars to plausible equivalents
-    s = baudottty.wordwrap(s)               # word wrap
-    ui.tty.doprint(s)
+    ui.tty.doprint(s, wrap=True)            # print, word wrapped
     ui.tty.doprint("\n\n\n")
 #
 #    formatforsms  -- format text with SMS conventions.
@@ -201,6 +203,7 @@ class uireadtask(threading.Thread) :
                     if b == baudot.Baudot.NULL :            # if received a NULL when not reading
                         self.owner.logger.info("BREAK detected")            # treat as a break
                         tty.flushOutput()                   # Flush whatever was printing
+                        self.owner.feeds.wakeup()           # stop waiting for traffic
                         break                               # ignore remaining input
                     else :                                  # non-break while printing
                         self.owner.logger.debug("Ignoring input.")
@@ -267,7 +270,11 @@ class simpleui(object) :
         self.needeject = False                              # need a page eject
         self.newsfeeds = newsfeeds                          # URL list from which to obtain news via RSS
         self.weathercity = (None, None)                     # state, city for weather
-        self.itemprinting = None                            # ID of what's currently being printed
+        self.itemsunprinted = []                            # items taken from feeds, or cancelled by BREAK, to print
+        self.itemsspooled = 0                               # items rendered and waiting in spooler
+        self.prefetch = 2                                   # items to render ahead of printing
+        self.ladder = None                                  # shortens news when far behind, if configured
+        self.feedstate = None                               # news items seen, kept across restarts, if configured
         self.uilock = threading.Lock()                      # lock object
         self.inqueue = queue.Queue()                        # input queue
         #   Set global socket timeout so feed readers don't hang.
@@ -290,6 +297,21 @@ class simpleui(object) :
             
         if config.has_section("format") :                   # format config
             self.cutmarks = config.getboolean("format","cutmarks")
+            if config.has_option("format","prefetch") :     # items to render ahead
+                self.prefetch = max(1, config.getint("format","prefetch"))
+            if any(config.has_option("format", option)      # if shortening news when far behind
+                    for option in ("paragraphbacklog", "headlinebacklog", "skipbacklog")) :
+                def backlogsecs(option) :                   # threshold in minutes, 0 for never
+                    if not config.has_option("format", option) :
+                        return(None)
+                    minutes = config.getfloat("format", option)
+                    return(minutes * 60.0 if minutes > 0 else None)
+                recover = 0.5                               # step back up at half the threshold
+                if config.has_option("format","backlogrecover") :
+                    recover = config.getfloat("format","backlogrecover")
+                self.ladder = feedmanager.FormatLadder(backlogsecs("paragraphbacklog"),
+                    backlogsecs("headlinebacklog"), backlogsecs("skipbacklog"),
+                    recover, self.logger)
             if self.smsmsgfeed :                            # if have SMS feed
                self.smsmsgfeed.setheaders(
                     expandescapes(config.get("format","header")),
@@ -300,24 +322,64 @@ class simpleui(object) :
                 config.get("weather", "zip"))               # city, state, zip
         #    Initialize TTY
         self.readtask = uireadtask(self)                    # input task
+        self.spooler = baudottty.Spooler(tty)               # prints items while the next is prepared
         #    Build list of feeds to follow
         self.feeds = feedmanager.Feeds(self.logger)         # create a news feed object 
+        if config.has_option("polling","workers") :         # if many feeds, poll from a thread pool
+            self.feeds.setscheduler(feedmanager.FetchPool(self.logger,
+                max(1, config.getint("polling","workers"))))
+        elif (config.has_option("polling","maxfetches") or
+                config.has_option("polling","maxperhost")) :  # if many feeds, poll from one thread
+            maxfetches = feedscheduler.KMAXFETCHES
+            maxperhost = feedscheduler.KMAXPERHOST
+            if config.has_option("polling","maxfetches") :  # fetches at once, all hosts
+                maxfetches = max(1, config.getint("polling","maxfetches"))
+            if config.has_option("polling","maxperhost") :  # fetches at once, one host
+                maxperhost = max(1, config.getint("polling","maxperhost"))
+            self.feeds.setscheduler(feedscheduler.FeedScheduler(self.logger, maxfetches, maxperhost))
+        if config.has_section("budget") :                   # if limiting news printing time
+            self.feeds.setbudget(feedmanager.PrintBudget(
+                config.getfloat("budget", "window") * 60.0,
+                config.getfloat("budget", "printminutes") * 60.0,
+                config.getfloat("budget", "halflife") * 60.0,
+                config.getfloat("budget", "maxage") * 60.0,
+                tty.charsecs))
+        if config.has_option("state","dir") :               # if remembering news seen across restarts
+            statedir = os.path.expanduser(config.get("state","dir"))
+            if not os.path.isdir(statedir) :                # create on first use
+                os.makedirs(statedir)
+            self.feedstate = feedstate.FeedState(os.path.join(statedir, "feedstate.db"), self.logger)
+        minpoll = newsfeed.KPOLLMIN                         # adaptive news poll interval bounds
+        maxpoll = newsfeed.KPOLLMAX
+        if config.has_option("polling","minpoll") :         # minutes
+            minpoll = config.getfloat("polling","minpoll") * 60.0
+        if config.has_option("polling","maxpoll") :
+            maxpoll = max(minpoll, config.getfloat("polling","maxpoll") * 60.0)
+        weights = {}                                        # URL -> share of printing, default 1
+        if config.has_section("weights") and config.has_section("feeds") :
+            for (name, url) in config.items("feeds") :      # weights are by feed name
+                if config.has_option("weights", name) :
+                    weights[url] = config.getfloat("weights", name)
         for url in newsfeeds :                              # for URLs listed
-            self.feeds.addfeed(newsfeed.Newsfeed(url, self.logger))
+            feed = newsfeed.Newsfeed(url, self.logger, self.feedstate)
+            feed.setpollbounds(minpoll, maxpoll)            # before it starts polling
+            if url in weights :
+                feed.setweight(weights[url])                # before it queues anything
+            self.feeds.addfeed(feed)
         if self.smsmsgfeed :
             self.feeds.addfeed(self.smsmsgfeed)             # make this feed active
 
     def sendcutmark(self) :                                 # cut paper here
         if self.cutmarks :                                  # if cutmarks enabled
             if self.needcut :
-                self.tty.doprint(CUTMARK)                  # send cut mark
+                self.spooler.submit(CUTMARK)                # send cut mark
         self.needcut = False                                # no cutmark needed
 
     def sendeject(self) :                                   # paper eject, sent when printer goes idle
         if self.cutmarks :                                  # if cutmarks enabled
             if self.needeject :                             # if printed something
-                self.tty.doprint(CUTMARK)                  # send cut, then
-                self.tty.doprint(EJECTSTR)                    # send eject
+                self.spooler.submit(CUTMARK)                # send cut, then
+                self.spooler.submit(EJECTSTR)               # send eject
         self.needeject = False                              # no eject needed
 
     def draininput(self) :                                  # consume any queued input
@@ -341,74 +403,127 @@ class simpleui(object) :
             raise ch                                        # reraise exception here
         self.tty.doprint("\n")                              # send CR to turn on motor and wake up
 
+    #
+    #    itemspooled  -- called from spooler thread when an item has been printed or cancelled
+    #
+    def itemspooled(self, item, completed, saved) :
+        with self.uilock :                                  # UI thread counts up, we count down
+            self.itemsspooled -= 1                          # one less in spooler
+            if not completed :                              # if cancelled by BREAK
+                self.itemsunprinted.append(item)            # print it again next time
+                return
+        if saved :                                          # shift chars saved printing story
+            self.logger.debug("Shift optimization saved %d chars." % (saved,))
+        item.itemdone()                                     # mark item as done
+
     #
     #    waitfortraffic  -- normal loop, waiting for something to come in.
     #
+    #    Items are formatted and converted to Baudot here, and printed by the
+    #    spooler.  Up to "prefetch" items are kept ready in the spooler, so the
+    #    printer goes straight from one item to the next.
+    #    When idle, this blocks until a feed queues an item, a BREAK, or
+    #    it is time to turn the motor off.  There is no periodic wakeup.
+    #
     def waitfortraffic(self, feed) :
         waiting = False
         feed.setlasttitleprinted(None)                      # forget last title printed; print new title on wakeup
         tty = self.tty                                      # the teletype to print to
+        spooler = self.spooler                              # prints for us
         while True :                                        # read repeatedly - one story per iteration
-            if not self.itemprinting :                      # if no unprinted item pending
-                self.itemprinting = feed.getitem()          # get a new news item
-            if self.itemprinting :                          # if something to print
-                title = self.itemprinting.gettitle()        # get title
-                s = self.itemprinting.formattext()          # item text
-                errmsg = self.itemprinting.errmsg           # error message if any
-                feedtype = self.itemprinting.feed.feedtype  # feed type
-                title = title.encode('ascii','replace').decode('ascii')
-                s = s.encode('ascii','replace').decode('ascii')  # limit to ASCII for the Teletype
-                if waiting :                                # if was waiting
-                    tty.doprint("\n\a")                     # wake up, ring bell
-                    waiting = False                         # we have a story to print
-                    powerdownstart = None                   # not waiting for motor power off
-                #    Need to cut paper here?
-                if title != feed.getlasttitleprinted() or feedtype == "SMS" :    # cut paper for source change or SMS
-                    self.needcut = True                     # cut paper here
-                self.sendcutmark()                          # cut paper here
-                #    Print feed title if it changed
-                if title != feed.getlasttitleprinted() :
-                    feed.setlasttitleprinted(title)         # save new title so we can tell if it changed
-                    title = tty.convertnonbaudot(title)     # convert special chars to plausible equivalents
-                    title = baudottty.wordwrap(title)       # word wrap
-                    self.logger.debug("Source: " + title)
-                    tty.doprint(title )                     # print title
-                    if errmsg :
-                        tty.doprint(ERRBELLS)              # ring bells here
-                    tty.doprint('\n')                       # end title line
-                s = tty.convertnonbaudot(s)           # convert special chars to plausible equivalents
-                s = baudottty.wordwrap(s)                   # word wrap
-                if s[-1] != '\n' :                          # end with NL
-                    s += '\n'
-                ssum = re.sub("\s+"," ", self.itemprinting.summarytext()).lstrip()[:80]    # summarize story/msg by truncation
-                self.logger.info("Printing: %s..." % (ssum,))        # print a bit of the new story
-                tty.doprint(s)                              # print item
-                self.itemprinting.itemdone()                # mark item as done
-                self.itemprinting = None                    # item has been used up
+            spooler.check()                                 # raise if BREAK during spooled printing
+            with self.uilock :
+                itemsspooled = self.itemsspooled
+            if itemsspooled >= self.prefetch :              # if enough items ready to print
+                spooler.waitforjob(1.0)                     # wait for one to print
+                continue
+            item = None
+            with self.uilock :
+                if self.itemsunprinted :                    # if cancelled or waited for items pending
+                    item = self.itemsunprinted.pop(0)       # print those first
+            if item is None :
+                item = feed.getitem()                       # get a new news item, if any
+            if item :                                       # if something to print
+                level = feedmanager.FORMATFULL              # print all of item unless far behind
+                if self.ladder and item.feed.getpriority(item) == feedmanager.PRIORITYNEWS :
+                    level = self.ladder.update(feed.backlogsecs(tty.charsecs) + spooler.backlogsecs())
+                if level == feedmanager.FORMATSKIP :        # too far behind to print news at all
+                    ssum = re.sub("\s+"," ", item.summarytext()).lstrip()[:80]
+                    self.logger.info("Skipped, too far behind: %s..." % (ssum,))
+                    item.itemdone()                         # don't try again
+                    continue
+                title = item.gettitle()                     # get title
+                s = item.formattext(level)                  # item text
+                errmsg = item.errmsg                        # error message if any
+                feedtype = item.feed.feedtype               # feed type
+                spooled = False                             # item not yet in spooler
+                try :                                       # any submit can raise on BREAK
+                    if waiting :                            # if was waiting
+                        tty.resetwirestats()                # measure printing of this backlog
+                        spooler.submit("\n\a")              # wake up, ring bell
+                        waiting = False                     # we have a story to print
+                    #    Need to cut paper here?
+                    if title != feed.getlasttitleprinted() or feedtype == "SMS" :    # cut paper for source change or SMS
+                        self.needcut = True                 # cut paper here
+                    self.sendcutmark()                      # cut paper here
+                    #    Print feed title if it changed
+                    if title != feed.getlasttitleprinted() :
+                        title = tty.convertnonbaudot(title) # convert special chars to plausible equivalents
+                        self.logger.debug("Source: " + title)
+                        if errmsg :
+                            title += ERRBELLS               # ring bells here
+                        spooler.submit(title + '\n', wrap=True) # print title, end title line
+                        feed.setlasttitleprinted(item.gettitle())   # save new title so we can tell if it changed
+                    s = tty.convertnonbaudot(s)             # convert special chars to plausible equivalents
+                    if s[-1] != '\n' :                      # end with NL
+                        s += '\n'
+                    ssum = re.sub("\s+"," ", item.summarytext()).lstrip()[:80]    # summarize story/msg by truncation
+                    self.logger.info("Printing: %s..." % (ssum,))        # print a bit of the new story
+                    with self.uilock :
+                        self.itemsspooled += 1              # one more in spooler
+                        spooled = True                      # callback will count it down
+                    spooler.submit(s, lambda completed, saved, item=item : self.itemspooled(item, completed, saved),
+                        wrap=True)                          # print item, word wrapped
+                except Exception :                          # BREAK or error, item was not queued
+                    with self.uilock :
+                        if spooled :                        # counted, but callback will not be called
+                            self.itemsspooled -= 1
+                        self.itemsunprinted.append(item)    # print it again next time
+                    raise
                 if errmsg is None :                         # if no error, get next story immediately
                     self.needeject = True                   # note that a page eject is needed on next idle
                     continue                                # try to get next story
             #    No traffic, wait for more to come in
-            if not waiting :
+            if not waiting and spooler.idle() :             # if everything has been printed
                 self.sendeject()                            # eject page if needed
                 if self.feeds.feedcount() == 0 :            # warn 
-                    tty.doprint("NO FEEDS CONFIGURED. NO POSSIBLE INCOMING TRAFFIC.\n")
-                tty.doprint("WAITING...")                   # indicate wait
+                    spooler.submit("NO FEEDS CONFIGURED. NO POSSIBLE INCOMING TRAFFIC.\n")
+                spooler.submit("WAITING...")                # indicate wait
                 waiting = True                              # waiting with motor off
                 feed.setlasttitleprinted(None)              # forget last title printed; print new title on wakeup
-                self.logger.info("No traffic, waiting...")
-            if tty.kybdinterrupt :                          # if interrupted by BREAK, but not printing
+                self.logger.info("No traffic, waiting...  Wire was busy %1.0f%% of the time." % 
+                    (tty.getwirebusy(),))
+            if tty.kybdinterrupt and spooler.idle() :       # if interrupted by BREAK, but not printing
                 self.logger.info("Keyboard interrupt")
                 return                                      # done
             #    Turn off motor after allowing enough time for all queued output.
             #    The USB serial devices have a huge queue.  We have to wait for it to empty.
-            if tty.motorison() :                            # if motor running
+            timeout = None                                  # wait for traffic as long as it takes
+            if tty.motorison() and spooler.idle() :         # if motor running and nothing to print
                 charsleft = tty.outwaiting()                # get chars left to print
                 ####print("Queued: %d" % (charsleft,))      # ***TEMP***
                 if charsleft <= 0 :                         # if done printing
                     tty.motor(False)                        # turn off Teletype motor
                     self.logger.info("Motor turned off.")
-            time.sleep(1)                                   # wait 1 sec for next cycle
+                else :                                      # check again when printing should be done
+                    timeout = tty.outwaitingtime()
+            if spooler.idle() :                             # if nothing printing
+                item = feed.getitem(timeout)                # wait for traffic, BREAK, or motor off time
+                if item :                                   # print it next time around
+                    with self.uilock :
+                        self.itemsunprinted.append(item)
+            else :                                          # feed may have more when this item is done
+                spooler.waitforjob(1.0)                     # wait for printing to progress
 
 
     def prompt(self, s, acceptset , maxchars = 1, timeout = None) :            # prompt and read reply
@@ -523,10 +638,13 @@ class simpleui(object) :
     def abortthreads(self) :                                # abort all subordinate threads, called from exception
         #    Abort feed tasks
         self.feeds.abort()                                  # abort all feed tasks
+        if self.feedstate :
+            self.feedstate.close()                          # save news items seen
         #    Abort read task.
         self.logger.debug("Waiting for read task to complete.")
         self.readtask.abort()                               # abort reading over at read task
         self.logger.debug("Read task has completed.")
+        self.spooler.abort()                                # abort print spooler
 
     def runui(self, initialcmd = None) :
         try :
@@ -536,6 +654,7 @@ class simpleui(object) :
                     initialcmd = "N"                        # read news, forever.
             self.readtask.daemon = True                     # don't let read task survive control-C
             self.readtask.start()                           # start input
+            self.spooler.start()                            # start printing
             self.uiloop(initialcmd)                         # run main UI loop
             
         except (EOFError, serial.SerialException) as message :            # if trouble
@@ -549,6 +668,9 @@ class simpleui(object) :
             self.logger.exception("Unrecoverable error, aborting: " + str(message))
             self.abortthreads()                             # abort all threads
             raise                                           # re-raise exception with other thread exited.
+        finally :                                           # however we leave, including control-C
+            if self.feedstate :
+                self.feedstate.close()                      # save news items seen
 
 
 
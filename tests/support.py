@@ -0,0 +1,129 @@
+#
+#    support.py  -  shared fakes for the tests
+#
+#    A serial port which just collects output, a BaudotTTY using it, and a
+#    feed whose items are queued by the test.
+#
+import os
+import sys
+import time
+import logging
+import threading
+import configparser
+import email.utils
+import http.server
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "messager"))
+import baudot
+import baudottty
+import feedmanager
+
+logger = logging.getLogger("tests")
+logger.addHandler(logging.NullHandler())
+logger.propagate = False
+
+class FakeSerial(object) :                              # collects output, reads nothing
+    def __init__(self) :
+        self.out = bytearray()
+        self.rts = False
+        self.dtr = False
+        self.baudrate = 45
+
+    def write(self, s) :
+        self.out += bytes(s)
+
+    def read(self) :
+        time.sleep(0.05)
+        return(b"")
+
+    def flushOutput(self) :
+        pass
+
+def maketty(charset="USTTY", lf=False, extraltrs=2, charsecs=0.0001) :
+    tty = baudottty.BaudotTTY()
+    tty.ser = FakeSerial()
+    tty.conv = baudot.Baudot(charset)
+    tty.motorstartdelay = 0.0
+    tty.charsecs = charsecs
+    tty.eolsettings(lf, extraltrs)
+    return(tty)
+
+def makeconfig(text="", cutmarks=False) :             # minimal configuration, plus "text"
+    config = configparser.ConfigParser()
+    config.read_string("[teletype]\nkeyboard: False\nhalfduplex: False\n[format]\ncutmarks: %s\n%s" % (cutmarks, text))
+    return(config)
+
+class TestFeed(feedmanager.Feed) :                      # feed which never polls
+    def __init__(self, name, feedtype="NEWS") :
+        feedmanager.Feed.__init__(self, feedtype, logger)
+        self.name = name
+        self.url = "http://%s.example.com/" % (name,)
+        self.done = []                                  # items marked done
+
+    def gettitle(self) :
+        return(self.name)
+
+    def getpollinterval(self) :
+        return(1000.0)
+
+    def fetchitems(self) :
+        pass
+
+    def itemdone(self, item) :
+        self.done.append(item)
+
+    def summarytext(self, item) :
+        return(item.body[:20])
+
+    def markallasread(self) :
+        pass
+
+    def unmarkallasread(self) :
+        pass
+
+    def add(self, body, subject="S") :                  # queue an item
+        item = feedmanager.FeedItem(self, self.name, "d", "t", subject, body)
+        self.queueitem(item)
+        return(item)
+
+class FeedHandler(http.server.BaseHTTPRequestHandler) :     # serves the server's current document
+    def do_GET(self) :
+        body = self.server.body.encode("utf8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/rss+xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) :
+        pass
+
+class FeedServer(http.server.HTTPServer) :              # local HTTP server for one feed document
+    def __init__(self) :
+        http.server.HTTPServer.__init__(self, ("127.0.0.1", 0), FeedHandler)
+        self.body = ""
+        self.url = "http://127.0.0.1:%d/feed.xml" % (self.server_address[1],)
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self) :
+        self.shutdown()
+        self.server_close()
+
+def rss(entries, title="TEST NEWS") :                   # RSS 2.0 document, entries are (guid, title, description)
+    date = email.utils.formatdate(time.time() - 60)
+    items = "".join("<item><guid>%s</guid><title>%s</title><description>%s</description>"
+        "<pubDate>%s</pubDate></item>" % (guid, title, description, date)
+        for (guid, title, description) in entries)
+    return('<?xml version="1.0"?><rss version="2.0"><channel><title>%s</title>'
+        '<link>http://example.com/</link><description>D</description>%s</channel></rss>' % (title, items))
+
+class Owner(object) :                                   # stands in for Feeds, collects queued items
+    def __init__(self) :
+        self.items = []
+
+    def queueitem(self, feed, item) :
+        self.items.append(item)
+
+    def iswanted(self, now) :
+        return(True)
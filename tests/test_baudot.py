@@ -0,0 +1,70 @@
+#
+#    test_baudot.py  -  tests for Baudot conversion
+#
+import random
+import unittest
+import support
+import baudot
+
+class CharsetTest(unittest.TestCase) :
+    def test_shared_tables(self) :                      # converters share one compiled Charset
+        b1 = baudot.Baudot("USTTY")
+        b2 = baudot.Baudot("usTTY")
+        self.assertIs(b1.tables, b2.tables)
+        self.assertIs(b1.tables, baudot.lookupcharset("USTTY"))
+        self.assertIs(b1.encodetabs, b2.encodetabs)
+        self.assertEqual(b1.getcharset(), "USTTY")
+        self.assertEqual(b1.chToBaudot(ord("3")), (0x01, baudot.Baudot.FIGS))
+        self.assertEqual(baudot.Baudot().getcharset(), "USTTY")
+
+    def test_unknown_charset(self) :
+        self.assertRaises(ValueError, baudot.Baudot, "NOSUCH")
+
+    def test_register_keeps_old_tables(self) :          # replacing a set doesn't change converters using it
+        old = baudot.Baudot("USTTY")
+        try :
+            figs = list(baudot.Charset.USTTYfigs)
+            figs[0x05] = "'"                            # bell and apostrophe swapped
+            figs[0x0b] = "\a"
+            baudot.registercharset("USTTY", baudot.Charset.USTTYltrs, figs)
+            new = baudot.Baudot("USTTY")
+            self.assertEqual(old.chToBaudot(ord("'")), (0x0b, baudot.Baudot.FIGS))
+            self.assertEqual(new.chToBaudot(ord("'")), (0x05, baudot.Baudot.FIGS))
+            self.assertEqual(old.encode("'")[0], new.encode("\a")[0])
+        finally :
+            baudot.registercharset("USTTY", baudot.Charset.USTTYltrs, baudot.Charset.USTTYfigs)
+
+class DecodeTest(unittest.TestCase) :
+    def perchar(self, conv, data, shift) :              # decode one char at a time, as the keyboard does
+        out = []
+        for b in data :
+            if b in (baudot.Baudot.LTRS, baudot.Baudot.FIGS) :
+                shift = b
+                continue
+            ch = conv.chToASCII(b, shift)
+            if ch is not None :
+                out.append(ch)
+        return("".join(out), shift)
+
+    def test_same_as_perchar(self) :
+        rand = random.Random(1)
+        values = list(range(32)) + [0x40, 0xff]         # and some out of range
+        for charset in ("USTTY", "ITA2", "FRACTIONS") :
+            conv = baudot.Baudot(charset)
+            for i in range(300) :
+                data = bytes(rand.choice(values) for j in range(rand.randint(0, 100)))
+                shift = rand.choice(baudot.Charset.SHIFTS)
+                self.assertEqual(conv.decode(data, shift), self.perchar(conv, data, shift))
+                self.assertEqual(conv.decode(bytearray(data), shift), conv.decode(memoryview(data), shift))
+
+    def test_round_trip(self) :
+        conv = baudot.Baudot("USTTY")
+        text = "QUOTE: \"1/2 OFF\" (TODAY)\rBIG SALE, 50$ & UP; WHY? 7'S!"
+        (data, shift, col) = conv.encode(text, baudot.Baudot.LTRS, 0)
+        self.assertEqual(conv.decode(data, baudot.Baudot.LTRS), (text, shift))
+        (text1, shift1) = conv.decode(data[:20], baudot.Baudot.LTRS)   # in pieces, carrying the shift
+        (text2, shift2) = conv.decode(data[20:], shift1)
+        self.assertEqual((text1 + text2, shift2), (text, shift))
+
+if __name__ == "__main__" :
+    unittest.main()
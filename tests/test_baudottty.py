@@ -0,0 +1,155 @@
+#
+#    test_baudottty.py  -  tests for Baudot teletype output
+#
+import random
+import unittest
+import support
+import baudot
+import baudottty
+
+KCHARS = "ABCDEFGHIJKLMNOPQRSTUVWXYZabc0123456789 -$!&#'()\"/:;?,.\n\n\r@~\a\u00e9"
+
+def perchar(tty, s) :                                   # print the old way, one char at a time
+    for chn in tty._prepare(s) :
+        (bb, shift) = tty.conv.chToBaudot(chn)
+        tty.writebaudotch(bb, shift)
+
+class EncodeTest(unittest.TestCase) :
+    def test_same_as_perchar(self) :                    # bulk encoder sends what writebaudotch did
+        rand = random.Random(1)
+        for i in range(1000) :
+            settings = (rand.choice(["USTTY", "ITA2", "FRACTIONS"]), rand.random() < 0.5, rand.choice([0, 2, 3]))
+            unshiftonspace = rand.choice([None, True, False])
+            s = "".join(rand.choice(KCHARS) for j in range(rand.randint(0, 200)))
+            (old, new) = (support.maketty(*settings), support.maketty(*settings))
+            for tty in (old, new) :
+                tty.shiftsettings(unshiftonspace)
+                if unshiftonspace :                     # a SPACE from unknown shift is known to be LTRS
+                    (tty.outputshift, tty.outputcol) = (baudot.Baudot.LTRS, 0)
+            for j in range(2) :                         # from the start state, then from where it ended
+                perchar(old, s)
+                new.doprint(s)
+                self.assertEqual((new.ser.out, new.outputshift, new.outputcol),
+                    (old.ser.out, old.outputshift, old.outputcol), repr((settings, unshiftonspace, s)))
+
+    def test_optimized_prints_same(self) :              # fewer shifts, same text, never longer
+        rand = random.Random(2)
+        for i in range(1000) :
+            settings = (rand.choice(["USTTY", "ITA2"]), rand.random() < 0.5, rand.choice([0, 2]))
+            unshiftonspace = rand.choice([None, True, False])
+            s = "".join(rand.choice(KCHARS) for j in range(rand.randint(0, 200)))
+            (plain, optimized) = (support.maketty(*settings), support.maketty(*settings))
+            plain.shiftsettings(unshiftonspace)
+            optimized.shiftsettings(unshiftonspace, True)
+            r = optimized.render(s)
+            plain.doprint(s)
+            optimized.printrendered(r)
+            self.assertEqual(len(optimized.ser.out) + r.saved, len(plain.ser.out))
+            self.assertEqual(optimized.outputcol, plain.outputcol)
+            if unshiftonspace is not None :             # text only known when the machine's shift is
+                self.assertEqual(optimized.conv.decode(optimized.ser.out)[0],
+                    plain.conv.decode(plain.ser.out)[0])
+
+class WrapTest(unittest.TestCase) :
+    def wrap(self, s, startcol=0, nonspacing="") :
+        return(list(baudottty.wraplines(s, startcol, 10, 4, nonspacing)))
+
+    def test_cases(self) :
+        self.assertEqual(self.wrap("AAAA BBBB CCCC"), ["AAAA BBBB", "CCCC"])
+        self.assertEqual(self.wrap("AAAAAAAAAA BBB"), ["AAAAAAAAAA", "BBB"])    # space at the margin
+        self.assertEqual(self.wrap("AAAAAAAAAAAAAAA"), ["AAAAAAAAAA", "AAAAA"])  # no break point
+        self.assertEqual(self.wrap("AAAA\r\nBB\n\nC"), ["AAAA", "BB", "", "C"])
+        self.assertEqual(self.wrap(""), [""])
+
+    def test_startcol(self) :
+        self.assertEqual(self.wrap("AAAA BBBB", 6), ["AAAA", "BBBB"])
+        self.assertEqual(self.wrap("AAAAAAAA", 8), ["", "AAAAAAAA"])    # no room, new line first
+        self.assertEqual(self.wrap("AA", 8), ["AA"])
+
+    def test_nonspacing(self) :                         # bells don't move the carriage
+        self.assertEqual(self.wrap("\a\a\aAAAAAAAAAA BB", nonspacing="\a"), ["\a\a\aAAAAAAAAAA", "BB"])
+        self.assertEqual(self.wrap("\a\a\aAAAAAAAAAA BB"), ["\a\a\aAAAAAAA", "AAA BB"])
+
+    def test_random(self) :                             # lines fit, and nothing but break spaces is lost
+        rand = random.Random(3)
+        for i in range(2000) :
+            s = "".join(rand.choice(["A", "B", " ", " ", "\n", "WORD ", "X" * 12, "\a"]) for j in range(rand.randint(0, 60)))
+            startcol = rand.randint(0, 12)
+            lines = list(baudottty.wraplines(s, startcol, 10, 4, "\a"))
+            for (n, line) in enumerate(lines) :
+                room = 10 - min(startcol, 10) if n == 0 else 10
+                self.assertLessEqual(len(line.replace("\a", "")), room, repr((s, startcol)))
+            self.assertEqual("".join("".join(lines).split()), "".join(s.split()))
+            self.assertEqual(baudottty.wordwrap(s, 10, 4), "\n".join(baudottty.wraplines(s, 0, 10, 4)))
+
+class BreakingSerial(support.FakeSerial) :             # BREAK, or fail, after some output
+    def __init__(self, tty, after, error=None) :
+        support.FakeSerial.__init__(self)
+        self.tty = tty
+        self.after = after
+        self.error = error
+
+    def write(self, s) :
+        if self.after is not None and len(self.out) >= self.after :
+            self.after = None                           # once only
+            if self.error :
+                raise self.error
+            self.tty.kybdinterrupt = True               # as the read thread does on BREAK
+        support.FakeSerial.write(self, s)
+
+class SpoolerTest(unittest.TestCase) :
+    def setUp(self) :
+        self.tty = support.maketty()
+        self.tty.shiftsettings(unshiftonspace=False, optimize=True)
+        self.spooler = baudottty.Spooler(self.tty)
+        self.spooler.start()
+
+    def tearDown(self) :
+        self.spooler.abort()
+
+    def test_saved_per_job(self) :                      # each job reports its own shift savings
+        reports = []
+        self.spooler.submit("1\n2\n3\n", lambda completed, saved : reports.append((completed, saved)))
+        self.spooler.submit("HELLO WORLD\n", lambda completed, saved : reports.append((completed, saved)))
+        self.spooler.wait()
+        self.tty.doprint("1\n2\n3\n")                   # printed outside the spooler, not reported
+        self.spooler.submit("HELLO AGAIN\n", lambda completed, saved : reports.append((completed, saved)))
+        self.spooler.wait()
+        self.assertEqual(reports, [(True, 3), (True, 0), (True, 0)])
+
+    def submitjobs(self, names, reports) :              # submit a job per name, each reporting (name, completed)
+        for name in names :
+            self.spooler.submit(name + " " + "X" * 100 + "\n",
+                lambda completed, saved, name=name : reports.append((name, completed)))
+
+    def test_break_cancels_queued(self) :               # BREAK stops the job printing and all behind it
+        self.spooler.abort()
+        self.spooler = baudottty.Spooler(self.tty)      # not started, so all jobs are queued first
+        self.tty.ser = BreakingSerial(self.tty, 40)
+        reports = []
+        self.submitjobs(["ONE", "TWO", "THREE"], reports)
+        self.spooler.start()
+        self.assertRaises(baudottty.BaudotKeyboardInterrupt, self.spooler.wait)
+        self.assertEqual(reports, [("ONE", False), ("TWO", False), ("THREE", False)])
+        self.assertLessEqual(len(self.tty.ser.out), 40 + 2 * baudottty.kwritechunk)   # stopped within a chunk
+        self.assertTrue(self.spooler.idle())
+        self.spooler.check()                            # reported once only
+        self.submitjobs(["FOUR"], reports)              # printing goes on after the BREAK
+        self.spooler.wait()
+        self.assertEqual(reports[-1], ("FOUR", True))
+        self.assertIn("FOUR", self.tty.conv.decode(self.tty.ser.out)[0])
+
+    def test_error_cancels_queued(self) :               # failure is raised to the submitter
+        self.spooler.abort()
+        self.spooler = baudottty.Spooler(self.tty)
+        self.tty.ser = BreakingSerial(self.tty, 40, IOError("port gone"))
+        reports = []
+        self.submitjobs(["ONE", "TWO"], reports)
+        self.spooler.start()
+        self.assertRaises(IOError, self.spooler.wait)
+        self.assertEqual(reports[-1], ("TWO", False))   # job behind it not printed
+        self.assertNotIn("TWO", self.tty.conv.decode(self.tty.ser.out)[0])
+        self.spooler.check()
+
+if __name__ == "__main__" :
+    unittest.main()
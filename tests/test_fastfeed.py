@@ -0,0 +1,88 @@
+#
+#    test_fastfeed.py  -  tests for the simple RSS and Atom parser
+#
+import time
+import unittest
+import feedparser
+import support
+import fastfeed
+import msgutils
+
+RSSITEM = ('<item><title>Story %d &amp; more</title><guid>http://example.com/%d</guid>'
+    '<link>http://example.com/story/%d</link><pubDate>Sat, 17 Oct 2026 10:%02d:00 GMT</pubDate>'
+    '<description>&lt;p&gt;Body of &lt;b&gt;story&lt;/b&gt; %d.&lt;/p&gt;&lt;p&gt;More.&lt;/p&gt;</description></item>')
+ATOMENTRY = ('<entry><title type="text">Story %d &amp; more</title><id>urn:example:%d</id>'
+    '<link href="http://example.com/story/%d"/><updated>2026-10-17T10:%02d:00+02:00</updated>'
+    '<summary type="html">&lt;p&gt;Body of &lt;b&gt;story&lt;/b&gt; %d.&lt;/p&gt;&lt;p&gt;More.&lt;/p&gt;</summary></entry>')
+
+def rssdoc(items, channel="<title>Test News</title><description>About</description>") :
+    return(('<?xml version="1.0"?><rss version="2.0"><channel>%s%s</channel></rss>' %
+        (channel, "".join(items))).encode("utf8"))
+
+def atomdoc(entries, header="<title>Test News</title><subtitle>About</subtitle>") :
+    return(('<?xml version="1.0"?><feed xmlns="http://www.w3.org/2005/Atom">%s%s</feed>' %
+        (header, "".join(entries))).encode("utf8"))
+
+class ParseTest(unittest.TestCase) :
+    def same_as_feedparser(self, body) :                # fields Newsfeed uses agree with feedparser's
+        d = fastfeed.parse(body)
+        f = feedparser.parse(body)
+        self.assertIsNotNone(d)
+        self.assertEqual((d.feed.title, d.feed.description), (f.feed.title, f.feed.description))
+        self.assertEqual(len(d.entries), len(f.entries))
+        for (entry, fentry) in zip(d.entries, f.entries) :
+            self.assertEqual(entry.id, fentry.id)
+            self.assertEqual(entry.link, fentry.link)
+            self.assertEqual(entry.published_parsed, fentry.get("published_parsed", fentry.get("updated_parsed")))
+            self.assertEqual(msgutils.htmltotext(entry.title), msgutils.htmltotext(fentry.title))
+            self.assertEqual(msgutils.htmltotext(entry.description), msgutils.htmltotext(fentry.description))
+
+    def test_rss(self) :
+        self.same_as_feedparser(rssdoc([RSSITEM % (n, n, n, n, n) for n in range(5)]))
+
+    def test_atom(self) :
+        self.same_as_feedparser(atomdoc([ATOMENTRY % (n, n, n, n, n) for n in range(5)]))
+
+    def test_dcdate(self) :                             # RSS with dc:date instead of pubDate
+        item = ('<item xmlns:dc="http://purl.org/dc/elements/1.1/"><title>T</title>'
+            '<dc:date>2026-10-17T10:00:00Z</dc:date><description>D</description></item>')
+        d = fastfeed.parse(rssdoc([item]))
+        self.assertEqual(d.entries[0].published_parsed, time.gmtime(1792231200))
+
+    def test_rejected(self) :                           # left to feedparser
+        good = RSSITEM % (1, 1, 1, 1, 1)
+        for body in [
+                rssdoc([good, good.replace("<pubDate>Sat, 17 Oct 2026 10:01:00 GMT</pubDate>", "")]),
+                rssdoc([good, good.replace("Sat, 17 Oct 2026", "sometime")]),
+                rssdoc([good, good.replace("description>", "summary>")]),
+                rssdoc([good], channel="<description>No title</description>"),
+                rssdoc([good])[:-20],                   # truncated
+                atomdoc(['<entry><title>T</title><updated>2026-10-17T10:00:00Z</updated>'
+                    '<content type="xhtml"><div xmlns="http://www.w3.org/1999/xhtml">X</div></content></entry>']),
+                b'<?xml version="1.0"?><rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"'
+                    b' xmlns="http://purl.org/rss/1.0/"><channel><title>T</title></channel></rdf:RDF>',
+                b'<html><body>Not a feed</body></html>'] :
+            self.assertIsNone(fastfeed.parse(body), repr(body))
+
+    def test_streaming(self) :                          # entries come out before the rest is parsed
+        body = rssdoc([RSSITEM % (n, n, n, n, n) for n in range(3)])
+        body = body.replace(b"</channel>", b"<item><title>broken</item></channel>")
+        feed = fastfeed.ParsedDict()
+        entries = fastfeed.iterentries(body, feed)
+        self.assertEqual([next(entries).id for n in range(3)],
+            ["http://example.com/0", "http://example.com/1", "http://example.com/2"])
+        self.assertEqual(feed.title, "Test News")
+        self.assertRaises(fastfeed.Rejected, next, entries)
+
+class DigestTest(unittest.TestCase) :
+    def test_unchanged(self) :
+        body = rssdoc([RSSITEM % (1, 1, 1, 1, 1)])
+        digest = fastfeed.bodydigest(body)
+        self.assertTrue(fastfeed.unchanged(body, digest))
+        self.assertFalse(fastfeed.unchanged(body.replace(b"Story 1", b"Story 2"), digest))  # same length
+        self.assertFalse(fastfeed.unchanged(body + b" ", digest))
+        self.assertFalse(fastfeed.unchanged(body, None))
+        self.assertFalse(fastfeed.unchanged(b"", fastfeed.bodydigest(body)))
+
+if __name__ == "__main__" :
+    unittest.main()
@@ -0,0 +1,144 @@
+#
+#    test_feedmanager.py  -  tests for the merged item queue
+#
+import time
+import unittest
+import support
+import feedmanager
+import newsfeed
+
+class FairQueueTest(unittest.TestCase) :
+    def setUp(self) :
+        self.feeds = feedmanager.Feeds(support.logger)
+        self.a = support.TestFeed("A")
+        self.b = support.TestFeed("B")
+        for feed in (self.a, self.b) :
+            feed.owner = self.feeds                     # no polling threads needed
+
+    def drain(self) :                                   # bodies of all items, in order returned
+        out = []
+        while True :
+            item = self.feeds.getitem()
+            if not item :
+                return(out)
+            out.append(item.body)
+            item.itemdone()
+
+    def test_turns(self) :
+        for i in range(3) :
+            self.a.add("A%d" % i)
+        for i in range(3) :
+            self.b.add("B%d" % i)
+        out = self.drain()
+        for (prev, next) in zip(out, out[1:]) :         # feeds take turns
+            self.assertNotEqual(prev[0], next[0])
+        self.assertEqual([body for body in out if body[0] == "A"], ["A0", "A1", "A2"])
+
+    def test_weights(self) :
+        self.a.setweight(2)
+        for i in range(4) :
+            self.a.add("A%d" % i)
+            self.b.add("B%d" % i)
+        out = self.drain()
+        self.assertEqual(sorted(body[0] for body in out[:6]), list("AAAABB"))    # two turns to one
+
+    def test_bad_weight(self) :
+        self.assertRaises(ValueError, self.a.setweight, 0)
+        self.assertRaises(ValueError, self.a.setweight, -1)
+
+    def test_priority(self) :
+        self.a.add("NEWS")
+        item = feedmanager.FeedItem(self.b, "B", "d", "t", "S", "", errmsg="FAILED")
+        self.b.queueitem(item)
+        self.assertEqual(self.feeds.getitem(), item)    # errors before news
+
+    def test_drain(self) :
+        self.a.add("A0")
+        self.b.add("B0")
+        self.a.drainqueue()
+        self.assertEqual(self.a.queued, 0)
+        self.assertEqual(self.drain(), ["B0"])
+        self.assertEqual(self.feeds.backlogsecs(1.0), 0.0)
+
+class PrintBudgetTest(unittest.TestCase) :
+    def setUp(self) :
+        self.feeds = feedmanager.Feeds(support.logger)
+        self.budget = feedmanager.PrintBudget(3600.0, 10.0, 3600.0, 600.0, 0.1)
+        self.feeds.setbudget(self.budget)
+        self.a = support.TestFeed("A")
+        self.a.owner = self.feeds
+
+    def olditem(self, body, agesecs) :                  # queue an item "agesecs" old
+        item = feedmanager.FeedItem(self.a, "A", "d", "t", "S", body)
+        item.timestamp = time.time() - agesecs
+        self.a.queueitem(item)
+        return(item)
+
+    def test_held_items_do_not_stop_polling(self) :
+        self.budget.charge(time.time(), 10.0)           # budget used up
+        self.a.add("X" * 20)
+        self.assertEqual(self.a.polldelay(), self.a.krecheckinterval)  # ready until we know it is held
+        self.assertIsNone(self.feeds.getitem(0.0))      # held by budget
+        self.assertEqual(self.a.queued, 1)
+        self.assertEqual(self.feeds.readycount(self.a), 0)
+        self.assertEqual(self.a.polldelay(), 0.0)       # never polled, so poll now
+
+    def test_ready_items_delay_polling(self) :
+        self.a.add("X" * 20)
+        self.assertEqual(self.feeds.readycount(self.a), 1)
+        self.assertEqual(self.a.polldelay(), self.a.krecheckinterval)
+
+    def test_purge_behind_held_item(self) :
+        self.budget.charge(time.time(), 10.0)           # budget used up
+        self.olditem("OLD" * 10, 1000.0)                # expired, ranks below fresh news
+        self.a.add("NEW1")
+        self.assertIsNone(self.feeds.getitem(0.0))      # fresh item held, old one behind it
+        self.assertEqual(self.a.queued, 2)
+        self.feeds.lastpurge = 0.0                      # purge on next queueing
+        self.a.add("NEW2")
+        self.assertEqual(self.a.queued, 2)
+        self.assertEqual(len(self.feeds.queue), 2)
+        self.assertEqual(sorted(entry[-1].body for entry in self.feeds.queue), ["NEW1", "NEW2"])
+
+    def test_stale_at_top(self) :
+        self.olditem("OLD", 1000.0)
+        self.assertIsNone(self.feeds.getitem(0.0))
+        self.assertEqual(self.a.queued, 0)
+        self.assertEqual(self.a.queuedheld, 0)
+
+class PollIntervalTest(unittest.TestCase) :
+    def test_busy_feed(self) :                          # polls about twice per item
+        poll = feedmanager.PollInterval(90.0, 60.0, 3600.0)
+        for i in range(20) :
+            poll.arrived(1, i * 600.0)
+        self.assertAlmostEqual(poll.getinterval(), 300.0)
+        poll.arrived(10, 20 * 600.0)                    # sudden burst, polls sooner, not below minimum
+        self.assertLess(poll.getinterval(), 300.0)
+        for i in range(20) :
+            poll.arrived(1, 20 * 600.0 + i)
+        self.assertEqual(poll.getinterval(), 60.0)
+
+    def test_backoff_and_hint(self) :
+        poll = feedmanager.PollInterval(90.0, 60.0, 3600.0)
+        poll.nochange()
+        self.assertEqual(poll.getinterval(), 135.0)
+        for i in range(20) :
+            poll.nochange()
+        self.assertEqual(poll.getinterval(), 3600.0)
+        poll = feedmanager.PollInterval(90.0, 60.0, 3600.0)
+        poll.nochange(1800.0)                           # server asks for a wait
+        self.assertEqual(poll.getinterval(), 1800.0)
+        poll.nochange(86400.0)                          # but no longer than the maximum
+        self.assertEqual(poll.getinterval(), 3600.0)
+
+    def test_news_default_cap(self) :                   # quiet news feeds poll as often as they used to
+        feed = newsfeed.Newsfeed("http://news.example.com/rss", support.logger)
+        for i in range(20) :
+            feed.pollinterval.nochange(3600.0)
+        self.assertEqual(feed.getpollinterval(), newsfeed.KPOLLINTERVAL)
+        feed.setpollbounds(60.0, 3600.0)                # configured maxpoll lets them back off
+        feed.pollinterval.nochange()
+        self.assertGreater(feed.getpollinterval(), newsfeed.KPOLLINTERVAL)
+
+if __name__ == "__main__" :
+    unittest.main()
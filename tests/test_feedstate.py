@@ -0,0 +1,81 @@
+#
+#    test_feedstate.py  -  tests for news feed state kept across restarts
+#
+import os
+import shutil
+import tempfile
+import unittest
+import support
+import feedstate
+
+URL = "http://news.example.com/rss"
+
+class FeedStateTest(unittest.TestCase) :
+    def setUp(self) :
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "feedstate.db")
+
+    def tearDown(self) :
+        shutil.rmtree(self.dir)
+
+    def restart(self, state) :                          # close, and open again as a new run would
+        state.close()
+        return(feedstate.FeedState(self.path, support.logger))
+
+    def test_seen_survives_restart(self) :
+        state = feedstate.FeedState(self.path, support.logger)
+        seen = feedstate.SeenItems(state, URL)
+        self.assertFalse(seen.known())
+        seen["a"] = 1.0
+        seen["b"] = 2.0
+        seen["a"] = 3.0                                 # seen again, now newest
+        seen.flush()
+        state = self.restart(state)
+        seen = feedstate.SeenItems(state, URL)
+        self.assertTrue(seen.known())
+        self.assertEqual(list(seen.items()), [("b", 2.0), ("a", 3.0)])
+        self.assertEqual(list(feedstate.SeenItems(state, URL + "/other").items()), [])
+        state.close()
+
+    def test_unflushed_saved_on_close(self) :           # close writes what the last poll left pending
+        state = feedstate.FeedState(self.path, support.logger)
+        seen = feedstate.SeenItems(state, URL)
+        seen["a"] = 1.0
+        state.setfeed(URL, "etag1", "modified1", "TITLE", "digest1")
+        state = self.restart(state)
+        self.assertEqual(state.load(URL), [("a", 1.0)])
+        self.assertEqual(state.getfeed(URL), ("etag1", "modified1", "TITLE", "digest1"))
+        self.assertEqual(state.getfeed(URL + "/other"), (None, None, None, None))
+        state.close()
+
+    def test_forget_and_expire(self) :
+        state = feedstate.FeedState(self.path, support.logger)
+        seen = feedstate.SeenItems(state, URL)
+        for (digest, when) in [("a", 1.0), ("b", 2.0), ("c", 3.0), ("d", 4.0)] :
+            seen[digest] = when
+        seen.flush()
+        del(seen["b"])
+        self.assertEqual(seen.expire(3.5), 2)           # "a" and "c"
+        self.assertEqual(list(seen.keys()), ["d"])
+        seen.flush()
+        state = self.restart(state)
+        seen = feedstate.SeenItems(state, URL)
+        self.assertEqual(list(seen.keys()), ["d"])
+        seen.clear()
+        state = self.restart(state)
+        self.assertEqual(state.load(URL), [])
+        state.close()
+
+    def test_close_twice(self) :                        # shutdown paths may each close
+        state = feedstate.FeedState(self.path, support.logger)
+        state.seen(URL, "a", 1.0)
+        state.close()
+        state.seen(URL, "b", 2.0)                       # a feed thread still running
+        state.flush(URL)
+        state.close()
+        state = feedstate.FeedState(self.path, support.logger)
+        self.assertEqual(state.load(URL), [("a", 1.0)])
+        state.close()
+
+if __name__ == "__main__" :
+    unittest.main()
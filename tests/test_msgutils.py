@@ -0,0 +1,39 @@
+#
+#    test_msgutils.py  -  tests for HTML to text conversion
+#
+import random
+import unittest
+import support
+import msgutils
+
+def parsed(s) :                                         # conversion by the parser alone
+    extractor = msgutils.HTMLTextExtractor()
+    extractor.feed(s)
+    extractor.close()
+    return(extractor.gettext())
+
+class HTMLToTextTest(unittest.TestCase) :
+    def test_paragraphs_and_entities(self) :
+        self.assertEqual(msgutils.htmltotext("<p>One &amp; two</p><p>Three&mdash;four</p>"),
+            "One & two\n\nThree—four")
+        self.assertEqual(msgutils.htmltotext("A &#8220;quote&#8221;"), "A “quote”")
+        self.assertEqual(msgutils.htmltotext("<ul><li>a</li><li>b</li></ul>"), "a\nb")
+        self.assertEqual(msgutils.htmltotext("x<br/>y"), "x\n\ny")
+
+    def test_links_kept_gadgets_dropped(self) :
+        s = 'Read <a href="http://x/">more</a> here.<div class="feedflare"><a href="x">Share</a></div>'
+        self.assertEqual(msgutils.htmltotext(s), "Read more here.")
+
+    def test_other_markup(self) :                       # goes to the parser
+        self.assertIsNone(msgutils.plaintagstotext("a < b"))
+        self.assertEqual(msgutils.htmltotext("a < b"), "a < b")
+        self.assertEqual(msgutils.htmltotext('<p>x<script>var a = "<p>";</script>y</p>'), "xy")
+
+    def test_same_as_parser(self) :
+        rand = random.Random(1)
+        for i in range(3000) :
+            s = "".join(rand.choice(msgutils.KTESTPIECES) for j in range(rand.randint(0, 15)))
+            self.assertEqual(msgutils.htmltotext(s), parsed(s), repr(s))
+
+if __name__ == "__main__" :
+    unittest.main()
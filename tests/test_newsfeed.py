@@ -0,0 +1,152 @@
+#
+#    test_newsfeed.py  -  tests for news feed polling and duplicate removal
+#
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import support
+import feedstate
+import newsfeed
+
+def story(n, guid=None, body=None) :                    # (guid, title, description)
+    return((guid or "g%d" % (n,), "Story %d" % (n,), body or "Body of story %d." % (n,)))
+
+def rdf(entries) :                                      # RSS 1.0 document, which fastfeed leaves to feedparser
+    date = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() - 60))
+    items = "".join('<item rdf:about="http://example.com/%s"><link>http://example.com/%s</link>'
+        '<title>%s</title><description>%s</description><dc:date>%s</dc:date></item>' %
+        (guid, guid, title, description, date) for (guid, title, description) in entries)
+    return('<?xml version="1.0"?><rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#" '
+        'xmlns="http://purl.org/rss/1.0/" xmlns:dc="http://purl.org/dc/elements/1.1/">'
+        '<channel rdf:about="http://example.com/"><title>RDF NEWS</title><link>http://example.com/</link>'
+        '<description>D</description></channel>%s</rdf:RDF>' % (items,))
+
+class OldSeeding(newsfeed.Newsfeed) :                   # marks all as read the old way, digest of every entry
+    def seedentries(self, entries, now) :
+        for (entry, rawkey, seen) in entries :
+            self.doentry(entry, now, seen)
+            self.itemqueued[rawkey] = now
+
+class NewsTest(unittest.TestCase) :
+    def setUp(self) :
+        self.server = support.FeedServer()
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self) :
+        self.server.stop()
+        shutil.rmtree(self.dir)
+
+    def run_polls(self, feedclass, name, polls) :
+        """
+        Poll each document in turn, returning the titles printed after each.
+        None restarts the program, with the feed state on disk.
+        """
+        path = os.path.join(self.dir, name)
+        state = None
+        feed = None
+        printed = []
+        for doc in polls + [None] :
+            if doc is None :                            # restart
+                if state :
+                    state.close()
+                state = feedstate.FeedState(path, support.logger)
+                feed = feedclass(self.server.url, support.logger, state)
+                feed.owner = support.Owner()
+                continue
+            (body, fullscan) = doc
+            self.server.body = body
+            if fullscan :
+                feed.lastfullscan = 0.0
+            feed.fetchitems()
+            printed.append([item.subject for item in feed.owner.items])
+            feed.owner.items = []
+        return(printed)
+
+    def test_seeding_matches_digest_of_every_entry(self) :
+        first = [story(n) for n in range(5)]
+        polls = [None,
+            (support.rss(first), False),                # marked as read
+            (support.rss([story(5), story(1, guid="new1"), story(2, body="Changed story 2.")] + first), False),
+            None,
+            (support.rss([story(6), story(3, guid="new3")] + first), False),
+            (support.rss([story(4, guid="new4")] + first), True),
+            None,
+            (support.rss([story(0, guid="new0"), story(7)] + first), True)]
+        old = self.run_polls(OldSeeding, "old.db", polls)
+        new = self.run_polls(newsfeed.Newsfeed, "new.db", polls)
+        self.assertEqual(new, old)
+        self.assertEqual(new, [[], ["Story 5", "Story 2"], ["Story 6"], [], ["Story 7"]])
+
+    def test_seeding_survives_restart(self) :
+        first = [story(n) for n in range(5)]
+        polls = [None,
+            (support.rss(first), False),                # marked as read
+            None,
+            (support.rss([story(1, guid="new1")] + first), False)]
+        self.assertEqual(self.run_polls(newsfeed.Newsfeed, "feeds.db", polls), [[], []])
+
+    def test_seeding_survives_full_scan(self) :
+        first = [story(n) for n in range(5)]
+        polls = [None,
+            (support.rss(first), False),                # marked as read
+            (support.rss(first[:3]), True),             # stories 3 and 4 gone for now
+            (support.rss([story(4, guid="new4")] + first[:3]), False)]
+        self.assertEqual(self.run_polls(newsfeed.Newsfeed, "feeds.db", polls), [[], [], []])
+
+    def test_restart_does_not_reprint(self) :
+        doc = (support.rss([story(n) for n in range(3)]), False)
+        self.assertEqual(self.run_polls(newsfeed.Newsfeed, "feeds.db", [None, doc]), [[]])
+        doc2 = (support.rss([story(3)] + [story(n) for n in range(3)]), False)
+        self.assertEqual(self.run_polls(newsfeed.Newsfeed, "feeds.db", [None, doc2, doc2]), [["Story 3"], []])
+
+    def test_feedparser_fallback(self) :                # feeds fastfeed rejects still print
+        first = [story(n) for n in range(3)]
+        polls = [None, (rdf(first), False), (rdf([story(3)] + first), False)]
+        self.assertEqual(self.run_polls(newsfeed.Newsfeed, "feeds.db", polls), [[], ["Story 3"]])
+
+    def test_incremental_scan(self) :                   # stop reading at entries already seen
+        old = [story(n) for n in range(30)]
+        feed = newsfeed.Newsfeed(self.server.url, support.logger)
+        feed.owner = support.Owner()
+        self.server.body = support.rss(old)
+        feed.fetchitems()                               # marked as read
+        self.server.body = support.rss([story(30)] + old)
+        d = feed.fetchfeed(time.time(), False)
+        self.assertEqual(d.scanned, 1 + newsfeed.KSEENSTOP)
+        self.assertEqual([entry.title for (entry, rawkey, seen) in d.entries], ["Story 30"])
+        d = feed.fetchfeed(time.time(), True)           # full scan looks at everything
+        self.assertEqual(d.scanned, 31)
+        self.assertEqual([seen for (entry, rawkey, seen) in d.entries], [False] + [True] * 30)
+
+    def test_full_scan_finds_late_entries(self) :       # entries added below the stopping point
+        old = [story(n) for n in range(30)]
+        polls = [None,
+            (support.rss(old), False),                  # marked as read
+            (support.rss(old[:20] + [story(30)] + old[20:]), False),
+            (support.rss([story(31)] + old[:20] + [story(30)] + old[20:]), True)]
+        self.assertEqual(self.run_polls(newsfeed.Newsfeed, "feeds.db", polls), [[], [], ["Story 31", "Story 30"]])
+
+    def test_same_document_not_parsed(self) :           # server without ETag or Last-Modified
+        old = [story(n) for n in range(30)]
+        late = support.rss(old[:20] + [story(30)] + old[20:])
+        polls = [None,
+            (support.rss(old), False),                  # marked as read
+            (late, False),                              # story 30 below where the scan stops
+            (late, False),                              # same document, not parsed
+            None,                                       # digest kept across restart
+            (late, False),                              # first poll of a run is a full scan
+            (late, False)]
+        feeds = []
+        class Counting(newsfeed.Newsfeed) :             # keeps the feeds made
+            def __init__(self, *args) :
+                newsfeed.Newsfeed.__init__(self, *args)
+                feeds.append(self)
+        self.assertEqual(self.run_polls(Counting, "feeds.db", polls), [[], [], [], ["Story 30"], []])
+        self.assertEqual([feed.parsesavoided for feed in feeds], [1, 1, 0])
+        self.assertIsNotNone(feeds[2].bodydigest)
+        self.assertEqual(feeds[2].bodydigest, feeds[1].bodydigest)
+
+if __name__ == "__main__" :
+    unittest.main()
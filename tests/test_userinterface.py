@@ -0,0 +1,128 @@
+#
+#    test_userinterface.py  -  tests for the printing loop
+#
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+import support
+import baudottty
+import feedstate
+import userinterface
+
+TITLE = "ALPHA NEWS"
+STORY = "STORY ONE " + "X" * 100
+
+class BreakTest(unittest.TestCase) :
+    """
+    BREAK during any submit for an item must leave the item to be printed again.
+    """
+
+    def setUp(self) :
+        self.tty = support.maketty(charsecs=0.001)
+        self.ui = userinterface.simpleui(self.tty, [], support.makeconfig(cutmarks=True), support.logger)
+        self.feed = support.TestFeed(TITLE)
+        self.ui.feeds.addfeed(self.feed)
+        self.ui.spooler.start()
+
+    def tearDown(self) :
+        self.ui.spooler.abort()
+
+    def run_ui(self) :                                  # run waitfortraffic in a thread, return result dict
+        result = {}
+        def run() :
+            try :
+                self.ui.waitfortraffic(self.ui.feeds)
+            except Exception as e :
+                result["exception"] = e
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        return(thread, result)
+
+    def waitfor(self, cond, timeout=5.0) :
+        deadline = time.time() + timeout
+        while not cond() and time.time() < deadline :
+            time.sleep(0.01)
+        return(cond())
+
+    def printed(self) :                                 # text sent to the Teletype
+        return(self.tty.conv.decode(self.tty.ser.out)[0])
+
+    def breakat(self, target) :                         # BREAK on first submit starting with target
+        spooler = self.ui.spooler
+        submit = spooler.submit
+        def breaking(s, *args, **kwargs) :
+            if s.startswith(target) :
+                spooler.submit = submit                 # once only
+                raise baudottty.BaudotKeyboardInterrupt("BREAK")
+            return(submit(s, *args, **kwargs))
+        spooler.submit = breaking
+        (thread, result) = self.run_ui()
+        self.assertTrue(self.waitfor(lambda : b"" != self.tty.ser.out and self.ui.spooler.idle()))
+        time.sleep(0.1)                                 # now waiting for traffic
+        item = self.feed.add(STORY)
+        thread.join(5.0)
+        self.assertFalse(thread.is_alive())
+        self.assertIsInstance(result.get("exception"), baudottty.BaudotKeyboardInterrupt)
+        self.assertEqual(self.ui.itemsunprinted, [item])
+        self.assertEqual(self.ui.itemsspooled, 0)
+        self.assertEqual(self.feed.done, [])
+        #   Resume printing; the item must come out
+        self.tty.ser.out = bytearray()
+        (thread, result) = self.run_ui()
+        self.assertTrue(self.waitfor(lambda : self.feed.done == [item]))
+        self.assertTrue(self.waitfor(lambda : "WAITING" in self.printed() and self.ui.spooler.idle()))
+        self.tty.kybdinterrupt = True                   # stop waitfortraffic
+        self.ui.feeds.wakeup()
+        thread.join(5.0)
+        self.assertFalse(thread.is_alive())
+        self.assertNotIn("exception", result)
+        self.assertEqual(self.ui.itemsspooled, 0)
+        self.assertEqual(self.ui.itemsunprinted, [])
+        out = self.printed()
+        self.assertIn(TITLE, out)
+        self.assertIn(STORY[:10], out)
+
+    def test_break_at_bell(self) :
+        self.breakat("\n\a")
+
+    def test_break_at_cutmark(self) :
+        self.breakat(userinterface.CUTMARK)
+
+    def test_break_at_title(self) :
+        self.breakat(TITLE)
+
+    def test_break_at_story(self) :
+        self.breakat(STORY[:10])
+
+class ShutdownTest(unittest.TestCase) :
+    """
+    Control-C must not lose news items seen since the last poll.
+    """
+
+    def setUp(self) :
+        self.dir = tempfile.mkdtemp()
+        config = support.makeconfig("[state]\ndir: %s\n" % (self.dir,))
+        self.ui = userinterface.simpleui(support.maketty(), [], config, support.logger)
+
+    def tearDown(self) :
+        self.ui.readtask.abort()
+        self.ui.spooler.abort()
+        shutil.rmtree(self.dir)
+
+    def test_control_c_saves_state(self) :
+        url = "http://news.example.com/rss"
+        def uiloop(initialcmd) :                        # a feed has seen an item, then control-C
+            self.ui.feedstate.seen(url, "a", 1.0)
+            raise KeyboardInterrupt()
+        self.ui.uiloop = uiloop
+        self.assertRaises(SystemExit, self.ui.runui)
+        state = feedstate.FeedState(os.path.join(self.dir, "feedstate.db"), support.logger)
+        self.assertEqual(state.load(url), [("a", 1.0)])
+        state.close()
+
+if __name__ == "__main__" :
+    unittest.main()